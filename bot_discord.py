@@ -1,18 +1,30 @@
+import time
+BOOT_STARTED = time.perf_counter()   # Buat laporan waktu startup
 import discord
 from discord.ext import commands
 import os
+import signal
+import sys
+import traceback
 import aiohttp
 import random
 import asyncio
+import contextlib
 import json
+import sqlite3
+import heapq
+import bisect
 from dotenv import load_dotenv
 
 # --- Tambahan buat Musik & Spotify ---
-import yt_dlp
+# yt_dlp dan spotipy sengaja gak di-import di sini (berat); di-load pas warm-up abis on_ready atau pas pertama dipake.
 import functools
+import itertools
 import re
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import collections
+import threading
+import concurrent.futures
+import shlex
 
 # --- PERSIAPAN BOT ---
 load_dotenv()
@@ -21,7 +33,43 @@ intents.guilds = True
 intents.members = True
 intents.message_content = True
 intents.voice_states = True # <-- PENTING: Izin buat liat status voice
-bot = commands.Bot(command_prefix="!", intents=intents)
+
+# Mode cache member: 'lean' cuma nyimpen member yang lagi di voice / baru join, gak nge-chunk semua member pas startup.
+# Member lain di-fetch pas perlu (MemberConverter bawaan discord.py udah nanya gateway/API kalo gak ada di cache). 'full' = perilaku lama (semua member di-chunk & disimpen).
+MEMBER_CACHE_MODE = os.getenv("MEMBER_CACHE_MODE", "lean")
+bot_options = {"command_prefix": "!", "intents": intents}
+if MEMBER_CACHE_MODE == "lean":
+    bot_options["member_cache_flags"] = discord.MemberCacheFlags(voice=True, joined=True)
+    bot_options["chunk_guilds_at_startup"] = False
+
+# --- SHARDING (DIISI SAMA cluster.py, ATAU MANUAL LEWAT .env) ---
+SHARD_COUNT = os.getenv("SHARD_COUNT")                   # Total shard semua proses
+SHARD_IDS = os.getenv("SHARD_IDS")                       # Shard yang dipegang proses ini, contoh: "0,1,2"
+CLUSTER_ID = os.getenv("CLUSTER_ID")                     # Nomer worker dari cluster.py (kosong = jalan sendirian)
+BOT_SHARDED = os.getenv("BOT_SHARDED") == "1" or bool(SHARD_COUNT)
+
+class FlushOnClose:
+    """close() matiin player musik dan ngirim pesan yang masih ketahan di outbox dulu, sebelum session HTTP-nya ditutup."""
+    async def close(self):
+        if not self.is_closed():
+            await close_players()
+            await outbox.close()
+        await super().close()
+
+class Bot(FlushOnClose, commands.Bot):
+    pass
+
+class ShardedBot(FlushOnClose, commands.AutoShardedBot):
+    pass
+
+if BOT_SHARDED:
+    bot = ShardedBot(
+        **bot_options,
+        shard_count=int(SHARD_COUNT) if SHARD_COUNT else None,
+        shard_ids=[int(shard_id) for shard_id in SHARD_IDS.split(",")] if SHARD_IDS else None,
+    )
+else:
+    bot = Bot(**bot_options)
 
 # --- KONFIGURASI TOKEN & KUNCI API ---
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
@@ -29,36 +77,559 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 SPOTIPY_CLIENT_ID = os.getenv("SPOTIPY_CLIENT_ID")
 SPOTIPY_CLIENT_SECRET = os.getenv("SPOTIPY_CLIENT_SECRET")
 
-# --- Inisialisasi Klien Spotify ---
-if SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET:
-    try:
-        auth_manager = SpotifyClientCredentials(client_id=SPOTIPY_CLIENT_ID, client_secret=SPOTIPY_CLIENT_SECRET)
-        sp = spotipy.Spotify(auth_manager=auth_manager)
-        print("Klien Spotify berhasil diinisialisasi.")
-    except Exception as e:
-        sp = None
-        print(f"Gagal inisialisasi klien Spotify: {e}")
-else:
-    sp = None
-    print("Peringatan: Kredensial Spotify tidak ditemukan di .env. Fitur Spotify tidak akan aktif.")
+# --- WAKTU STARTUP ---
+startup_phases = []   # [(nama fase, detik)]
+
+def record_phase(name, started):
+    startup_phases.append((name, time.perf_counter() - started))
+
+def startup_report():
+    lines = [f"  {name:<32}{seconds * 1000:>8.0f} ms" for name, seconds in startup_phases]
+    return "Laporan startup:\n" + "\n".join(lines)
+
+# --- LAYER ASYNC BUAT SPOTIFY ---
+SPOTIFY_CACHE_SIZE = int(os.getenv("SPOTIFY_CACHE_SIZE", "2048"))
+SPOTIFY_BATCH_SIZE = 50          # Maksimal ID per panggilan endpoint /tracks
+SPOTIFY_BATCH_DELAY = 0.05       # Nunggu bentar biar lookup yang barengan bisa digabung
+
+class SpotifyService:
+    """Semua panggilan spotipy lewat sini: jalan di thread sendiri, lookup lagu di-batch dan di-cache.
+
+    Cuma ada satu klien (dan satu auth manager), jadi token client-credentials-nya
+    dipake bareng. Executor-nya satu thread biar spotipy gak dipanggil barengan.
+    """
+    def __init__(self, client_id=SPOTIPY_CLIENT_ID, client_secret=SPOTIPY_CLIENT_SECRET, cache_size=SPOTIFY_CACHE_SIZE):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.client = None
+        self.cache_size = cache_size
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="spotify")
+        self._cache = collections.OrderedDict()   # track_id -> (judul, artis)
+        self._pending = {}                        # track_id -> future yang nunggu batch berikutnya
+        self._flush_handle = None
+
+    @property
+    def enabled(self):
+        return bool(self.client_id and self.client_secret)
+
+    def _ensure_client(self):
+        """Import spotipy dan bikin kliennya (jalan di thread Spotify, cuma sekali)."""
+        if self.client is None:
+            import spotipy
+            from spotipy.oauth2 import SpotifyClientCredentials
+            auth_manager = SpotifyClientCredentials(client_id=self.client_id, client_secret=self.client_secret)
+            self.client = spotipy.Spotify(auth_manager=auth_manager)
+            print("Klien Spotify berhasil diinisialisasi.")
+        return self.client
+
+    async def warm_up(self):
+        """Bikin klien Spotify duluan biar lookup pertama gak nunggu import spotipy."""
+        if not self.enabled:
+            print("Peringatan: Kredensial Spotify tidak ditemukan di .env. Fitur Spotify tidak akan aktif.")
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._ensure_client)
+        except Exception as e:
+            print(f"Gagal inisialisasi klien Spotify: {e}")
+
+    async def _call(self, method, *args, **kwargs):
+        """Panggil method klien spotipy di thread Spotify."""
+        def run():
+            return getattr(self._ensure_client(), method)(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, run)
+
+    def _remember(self, track):
+        info = (track['name'], track['artists'][0]['name'])
+        if track.get('id'):
+            self._cache[track['id']] = info
+            self._cache.move_to_end(track['id'])
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return info
+
+    async def track(self, track_id):
+        """Balikin (judul, artis) buat satu lagu."""
+        info = self._cache.get(track_id)
+        if info is not None:
+            self._cache.move_to_end(track_id)
+            return info
+        fut = self._pending.get(track_id)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = self._pending[track_id] = loop.create_future()
+            if len(self._pending) >= SPOTIFY_BATCH_SIZE:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(SPOTIFY_BATCH_DELAY, self._flush)
+        return await asyncio.shield(fut)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.create_task(self._fetch_batch(batch))
+
+    async def _fetch_batch(self, batch):
+        try:
+            result = await self._call('tracks', list(batch))
+        except Exception as e:
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (track_id, fut), track in zip(batch.items(), result['tracks']):
+            if fut.done():
+                continue
+            if track is None:
+                fut.set_exception(LookupError(f"Lagu Spotify {track_id} gak ketemu"))
+            else:
+                fut.set_result(self._remember(track))
+
+    async def collection_page(self, kind, spotify_id, offset):
+        """Satu halaman lagu dari playlist/album: ([(judul, artis)], jumlah item, masih ada halaman lagi?)."""
+        if kind == "playlist":
+            page = await self._call('playlist_items', spotify_id, limit=100, offset=offset, additional_types=('track',))
+            raw_tracks = [item.get('track') for item in page['items']]
+        else:
+            page = await self._call('album_tracks', spotify_id, limit=50, offset=offset)
+            raw_tracks = page['items']
+        tracks = [
+            self._remember(track) for track in raw_tracks
+            if track and track.get('name') and track.get('artists')   # Skip lagu lokal / yang udah dihapus
+        ]
+        return tracks, len(page['items']), page.get('next') is not None
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+spotify = SpotifyService()
 
 # --- JURUS PAMUNGKAS BUAT COOKIES YOUTUBE ---
 YT_COOKIES_CONTENT = os.getenv("YT_COOKIES")
 COOKIE_FILENAME = "youtube.com_cookies.txt"
+_cookie_lock = threading.Lock()
+_cookie_written = False
 
-if YT_COOKIES_CONTENT:
-    try:
-        # Tulis isi dari environment variable ke dalem file
-        with open(COOKIE_FILENAME, 'w') as f:
-            f.write(YT_COOKIES_CONTENT)
-        print("File cookies YouTube berhasil dibuat dari environment variable.")
-    except Exception as e:
-        print(f"Gagal nulis file cookies dari env var: {e}")
+def ensure_cookie_file():
+    """Tulis file cookies dari env var (sekali aja). Dipanggil pas warm-up atau sebelum ekstraksi pertama."""
+    global _cookie_written
+    if _cookie_written or not YT_COOKIES_CONTENT:
+        return
+    with _cookie_lock:
+        if _cookie_written:
+            return
+        try:
+            # Tulis isi dari environment variable ke dalem file
+            with open(COOKIE_FILENAME, 'w') as f:
+                f.write(YT_COOKIES_CONTENT)
+            print("File cookies YouTube berhasil dibuat dari environment variable.")
+        except Exception as e:
+            print(f"Gagal nulis file cookies dari env var: {e}")
+        _cookie_written = True
 # --- AKHIR JURUS PAMUNGKAS ---
 
 
+# --- METRIK (BUAT !stats DAN ENDPOINT PROMETHEUS) ---
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))          # 0 = endpoint HTTP-nya gak dinyalain
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LOOP_LAG_INTERVAL = 0.5
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRIC_BUCKETS) + 1)   # Slot terakhir buat +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(METRIC_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Perkiraan kasar (batas atas bucket-nya) buat persentil q."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(METRIC_BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """Histogram, counter, dan gauge sederhana di memori. Gak butuh library tambahan."""
+    def __init__(self):
+        self.histograms = {}   # (nama, label) -> Histogram
+        self.counters = {}     # (nama, label) -> angka
+        self.gauges = {}       # nama -> fungsi yang balikin angka
+        self.loop_lag = 0.0
+        self._tasks = []
+        self._runner = None
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name, value, **labels):
+        key = (name, self._labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, self._labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    def histogram(self, name, **labels):
+        return self.histograms.get((name, self._labels(labels))) or Histogram()
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, self._labels(labels)), 0)
+
+    def read_gauges(self):
+        values = {}
+        for name, func in self.gauges.items():
+            try:
+                values[name] = func()
+            except Exception:
+                values[name] = float("nan")
+        return values
+
+    def render_prometheus(self):
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            escaped = (f'{key}="{_escape_label(value)}"' for key, value in pairs)
+            return "{" + ",".join(escaped) + "}"
+
+        lines = []
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(METRIC_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f"bot_{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"bot_{name}_bucket{fmt(labels, [('le', '+Inf')])} {histogram.count}")
+            lines.append(f"bot_{name}_sum{fmt(labels)} {histogram.total}")
+            lines.append(f"bot_{name}_count{fmt(labels)} {histogram.count}")
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"bot_{name}{fmt(labels)} {value}")
+        for name, value in sorted(self.read_gauges().items()):
+            lines.append(f"bot_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def _measure_loop_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(0.0, time.monotonic() - started - LOOP_LAG_INTERVAL)
+            self.observe("event_loop_lag_seconds", self.loop_lag)
+
+    async def start(self, port=METRICS_PORT, host=METRICS_HOST):
+        self._tasks.append(asyncio.create_task(self._measure_loop_lag()))
+        if not port:
+            return
+        from aiohttp import web
+
+        async def handle_metrics(request):
+            return web.Response(text=self.render_prometheus(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        print(f"Endpoint metrik nyala di http://{host}:{port}/metrics")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+metrics = Metrics()
+
+
+# --- STORE LOKAL YANG DIPAKE BARENG ANTAR PROSES (MODE CLUSTER) ---
+CLUSTER_STATE_DB = os.getenv("CLUSTER_STATE_DB", "cluster_state.db")
+CLUSTER_HEARTBEAT_INTERVAL = 15
+SHARED_STORE_PRUNE_EVERY = 500                              # Hapus baris kadaluarsa tiap sekian kali nulis
+
+class SharedStore:
+    """Key-value kecil di SQLite (WAL) buat state yang harus sama di semua proses worker.
+
+    Cuma aktif kalo bot dijalanin lewat cluster.py (CLUSTER_ID diisi). Semua akses
+    lewat satu thread, jadi event loop gak pernah nunggu disk.
+    """
+    def __init__(self, path=CLUSTER_STATE_DB, enabled=bool(CLUSTER_ID)):
+        self.path = path
+        self.enabled = enabled
+        self._conn = None
+        self._writes = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-store")
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+            self._conn.commit()
+        return self._conn
+
+    def _get(self, key):
+        row = self._connection().execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def _put(self, key, value, expires_at):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, json.dumps(value), expires_at),
+            )
+            self._writes += 1
+            if self._writes % SHARED_STORE_PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    async def get(self, key):
+        if not self.enabled:
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._get, key)
+
+    async def put(self, key, value, expires_at=None):
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._put, key, value, expires_at)
+
+    def put_nowait(self, key, value, expires_at=None):
+        """Tulis di background, gak ditunggu (gagal nulis cuma di-print)."""
+        if not self.enabled:
+            return
+        fut = asyncio.get_running_loop().run_in_executor(self._executor, self._put, key, value, expires_at)
+        fut.add_done_callback(_report_shared_store_error)
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close)
+        self._executor.shutdown(wait=True)
+
+def _report_shared_store_error(fut):
+    if not fut.cancelled() and fut.exception() is not None:
+        print(f"Gagal nulis ke shared store: {fut.exception()}")
+
+shared_store = SharedStore()
+
+async def cluster_heartbeat():
+    """Lapor ke supervisor cluster.py kalo proses ini masih idup (dan event loop-nya gak nyangkut)."""
+    while True:
+        try:
+            await shared_store.put(f"heartbeat:{CLUSTER_ID}", {
+                "ts": time.time(),
+                "pid": os.getpid(),
+                "ready": bot.is_ready(),
+                "guilds": len(bot.guilds),
+                "shards": SHARD_IDS,
+            })
+        except Exception as e:
+            # Sekali gagal (misal database lagi ke-lock) jangan sampe heartbeat-nya mati, nanti worker-nya dianggep nyangkut
+            print(f"Gagal nulis heartbeat cluster: {e}")
+        await asyncio.sleep(CLUSTER_HEARTBEAT_INTERVAL)
+
+# --- KLIEN HTTP GEMINI (SATU SESSION BUAT SEMUA) ---
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-preview-05-20")
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))   # total request yang boleh jalan barengan
+GEMINI_MAX_PER_GUILD = int(os.getenv("GEMINI_MAX_PER_GUILD", "2"))       # jatah per server biar gak ada yang monopoli
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_RETRY_STATUSES = {429, 500, 502, 503, 504}
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "1") != "0"              # !tanya nampilin jawaban sambil ngalir
+
+class GeminiError(Exception):
+    """Error dari API Gemini (status selain 200 yang gak bisa di-retry)."""
+    def __init__(self, status, text):
+        super().__init__(f"{status}: {text}")
+        self.status = status
+        self.text = text
+
+class GuildLimiter:
+    """Batas barengan per server. Semaphore-nya dibikin pas perlu, terus dibuang lagi begitu gak ada yang make/nunggu (biar dict-nya gak numpuk)."""
+    def __init__(self, limit):
+        self.limit = limit
+        self._entries = {}   # guild_id -> [Semaphore, jumlah yang lagi make + nunggu]
+
+    def __len__(self):
+        return len(self._entries)
+
+    @contextlib.asynccontextmanager
+    async def hold(self, guild_id):
+        entry = self._entries.get(guild_id)
+        if entry is None:
+            entry = self._entries[guild_id] = [asyncio.Semaphore(self.limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._entries[guild_id]
+
+class GeminiClient:
+    """Klien Gemini yang hidup selama bot nyala: koneksi keep-alive, limit barengan, retry + backoff."""
+    def __init__(self, max_concurrency=GEMINI_MAX_CONCURRENCY, max_per_guild=GEMINI_MAX_PER_GUILD,
+                 max_retries=GEMINI_MAX_RETRIES, timeout=GEMINI_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_per_guild = max_per_guild
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = None
+        self._global_sem = asyncio.Semaphore(max_concurrency)
+        self._guild_limits = GuildLimiter(max_per_guild)
+
+    async def start(self):
+        if self.session is not None and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency * 2, ttl_dns_cache=300, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=self.timeout, connect=10)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def url(self, method="generateContent"):
+        return f"{GEMINI_API_BASE}/{GEMINI_MODEL}:{method}?key={GEMINI_API_KEY}"
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        return min(0.5 * (2 ** attempt), 8.0) + random.uniform(0, 0.25)
+
+    async def generate(self, text, guild_id=None):
+        """Kirim prompt ke generateContent, balikin JSON mentahnya. Lempar GeminiError kalo gagal."""
+        started = time.perf_counter()
+        try:
+            return await self._generate(text, guild_id)
+        except Exception as e:
+            metrics.inc("gemini_errors_total", method="generate", status=getattr(e, 'status', type(e).__name__))
+            raise
+        finally:
+            metrics.observe("gemini_request_seconds", time.perf_counter() - started, method="generate")
+
+    async def _generate(self, text, guild_id):
+        await self.start()
+        payload = {"contents": [{"parts": [{"text": text}]}]}
+        for attempt in range(self.max_retries + 1):
+            async with self._guild_limits.hold(guild_id), self._global_sem:
+                try:
+                    async with self.session.post(self.url(), json=payload) as response:
+                        if response.status == 200:
+                            return await response.json()
+                        error_text = await response.text()
+                        if response.status not in GEMINI_RETRY_STATUSES or attempt >= self.max_retries:
+                            raise GeminiError(response.status, error_text)
+                        delay = self._backoff(attempt, response)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+            # Tidur backoff-nya di luar semaphore, biar server lain gak ikut ketahan
+            metrics.inc("gemini_retries_total")
+            await asyncio.sleep(delay)
+
+    async def stream(self, text, guild_id=None):
+        """Kayak generate(), tapi lewat streamGenerateContent (SSE): nge-yield potongan teks begitu dateng.
+
+        Retry cuma dilakuin sebelum ada teks yang keluar, biar jawabannya gak dobel.
+        """
+        started = time.perf_counter()
+        try:
+            async for chunk in self._stream(text, guild_id):
+                yield chunk
+        except Exception as e:
+            metrics.inc("gemini_errors_total", method="stream", status=getattr(e, 'status', type(e).__name__))
+            raise
+        finally:
+            metrics.observe("gemini_request_seconds", time.perf_counter() - started, method="stream")
+
+    async def _stream(self, text, guild_id):
+        await self.start()
+        payload = {"contents": [{"parts": [{"text": text}]}]}
+        timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_read=self.timeout)
+        for attempt in range(self.max_retries + 1):
+            started = False
+            async with self._guild_limits.hold(guild_id), self._global_sem:
+                try:
+                    async with self.session.post(self.url("streamGenerateContent") + "&alt=sse", json=payload, timeout=timeout) as response:
+                        if response.status == 200:
+                            async for line in response.content:
+                                line = line.strip()
+                                if not line.startswith(b"data:"):
+                                    continue
+                                chunk = json.loads(line[5:])
+                                for candidate in chunk.get('candidates', [])[:1]:
+                                    for part in candidate.get('content', {}).get('parts', []):
+                                        if part.get('text'):
+                                            started = True
+                                            yield part['text']
+                            return
+                        error_text = await response.text()
+                        if response.status not in GEMINI_RETRY_STATUSES or attempt >= self.max_retries:
+                            raise GeminiError(response.status, error_text)
+                        delay = self._backoff(attempt, response)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if started or attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+            metrics.inc("gemini_retries_total")
+            await asyncio.sleep(delay)
+
+def gemini_text(data):
+    """Ngambil teks jawaban dari respons Gemini."""
+    return data['candidates'][0]['content']['parts'][0]['text']
+
+gemini_client = GeminiClient()
+
+
 # --- NAMA FILE UNTUK MENYIMPAN SKOR ---
-SCORE_FILE = "scores.json"
+SCORE_FILE = "scores.json"                                  # Format lama, cuma dibaca sekali buat migrasi
+SCORE_DB_FILE = os.getenv("SCORE_DB_FILE", "scores.db")
+SCORE_FLUSH_INTERVAL = float(os.getenv("SCORE_FLUSH_INTERVAL", "5"))
+LEGACY_SCORE_GUILD = 0                                      # Skor lama (sebelum dipisah per server) masuk ke sini
+LEADERBOARD_SIZE = 10
+USER_NAME_TTL = 3600                                        # Nama hasil fetch_user disimpen sejam
+USER_NAME_CACHE_MAX = 5000
 
 # --- DATABASE GIF ---
 FAIL_GIFS = [
@@ -74,12 +645,201 @@ RUN_GIFS = [
     "https://media1.giphy.com/media/v1.Y2lkPTc5MGI3NjExb2szYnRrdXZ4ZHFoaG03YnJjeXZoa3M2cTFhc3pmMW5lNXN4ODJsMCZlcD12MV9pbnRlcm5hbF9naWZfYnlfaWQmY3Q9Zw/NBAOL4ZPU4Pks/giphy.gif"
 ]
 
-game_states = {}
+# --- PESAN KELUAR YANG DIGABUNG PER CHANNEL ---
+DISCORD_MESSAGE_LIMIT = 2000
+DISCORD_EMBED_LIMIT = 10                                   # Maksimal embed per pesan
+OUTBOX_DELAY = float(os.getenv("OUTBOX_DELAY", "0.4"))     # Pesan status yang dateng dalam jeda ini dikirim jadi satu
+
+class Outbox:
+    """Pesan status (konfirmasi, hasil jawaban kuis, dll) dikumpulin per channel bentar, terus dikirim sekaligus.
+
+    Urutannya tetep: teks ditumpuk jadi satu pesan, embed nempel di pesan itu,
+    dan teks yang dateng abis embed masuk ke pesan berikutnya. Buat pesan yang
+    objek Message-nya gak dibutuhin; yang mau di-edit belakangan tetep kirim langsung.
+    """
+    def __init__(self, delay=OUTBOX_DELAY):
+        self.delay = delay
+        self._pending = {}   # channel.id -> [(teks, embed)] urut sesuai post()
+        self._tasks = {}     # channel.id -> task yang nunggu buat ngirim
+
+    def post(self, channel, content=None, embed=None):
+        items = self._pending.get(channel.id)
+        if items is None:
+            items = self._pending[channel.id] = []
+            self._tasks[channel.id] = asyncio.create_task(self._flush_later(channel))
+        items.append((content, embed))
+        metrics.inc("outbox_posts_total")
+
+    @staticmethod
+    def pack(items):
+        """Gabungin item jadi daftar (teks, [embed]) sesedikit mungkin tanpa ngerusak urutan."""
+        messages = []
+        lines, embeds = [], []
+        for content, embed in items:
+            if content is not None:
+                length = sum(len(line) + 1 for line in lines) + len(content)
+                if embeds or length > DISCORD_MESSAGE_LIMIT:
+                    messages.append(("\n".join(lines) or None, embeds))
+                    lines, embeds = [], []
+                lines.append(content)
+            if embed is not None:
+                if len(embeds) >= DISCORD_EMBED_LIMIT:
+                    messages.append(("\n".join(lines) or None, embeds))
+                    lines, embeds = [], []
+                embeds.append(embed)
+        if lines or embeds:
+            messages.append(("\n".join(lines) or None, embeds))
+        return messages
+
+    async def _flush_later(self, channel):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            pass   # Lagi shutdown: langsung kirim yang masih nunggu
+        self._tasks.pop(channel.id, None)
+        for content, embeds in self.pack(self._pending.pop(channel.id, [])):
+            try:
+                await channel.send(content=content, embeds=embeds)
+                metrics.inc("outbox_messages_sent_total")
+            except discord.HTTPException as e:
+                print(f"Gagal ngirim pesan ke channel {channel.id}: {e}")
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+outbox = Outbox()
+
+# --- SESI GAME (QUIZ / PETUALANGAN) ---
+GAME_SESSION_TTL = float(os.getenv("GAME_SESSION_TTL", "300"))      # Sesi yang gak disentuh segini lama dianggep ditinggal
+GAME_SWEEP_INTERVAL = float(os.getenv("GAME_SWEEP_INTERVAL", "30"))
+
+class GameSession:
+    """State satu game per user. Pake __slots__ biar irit memori kalo sesinya ribuan."""
+    __slots__ = ("user_id", "game_type", "expires_at", "channel", "user",
+                 "score", "questions", "current_q", "awaiting", "timer")
+
+    def __init__(self, user_id, game_type, expires_at, channel=None, user=None):
+        self.user_id = user_id
+        self.game_type = game_type
+        self.expires_at = expires_at
+        self.channel = channel
+        self.user = user
+        self.score = 0
+        self.questions = None
+        self.current_q = 0
+        self.awaiting = False
+        self.timer = None
+
+class GameSessionStore:
+    """Sesi game per user dengan TTL. Satu sweeper di background buang sesi yang udah ditinggal."""
+    def __init__(self, ttl=GAME_SESSION_TTL, sweep_interval=GAME_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sessions = {}     # user_id -> GameSession
+        self._by_channel = {}   # (channel_id, user_id) -> GameSession, buat dispatcher kuis
+        self.expired_count = 0
+        self.timed_out_count = 0
+        self._sweeper = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def get(self, user_id):
+        session = self._sessions.get(user_id)
+        if session is not None and session.expires_at <= time.monotonic():
+            self._remove(user_id)
+            self.expired_count += 1
+            return None
+        return session
+
+    def find(self, channel_id, user_id):
+        session = self._by_channel.get((channel_id, user_id))
+        if session is not None and session.expires_at <= time.monotonic():
+            return None
+        return session
+
+    def start(self, user_id, game_type, ttl=None, channel=None, user=None):
+        self._remove(user_id)
+        session = GameSession(user_id, game_type, time.monotonic() + (ttl or self.ttl), channel, user)
+        self._sessions[user_id] = session
+        if channel is not None:
+            self._by_channel[(channel.id, user_id)] = session
+        return session
+
+    def touch(self, session, ttl=None):
+        session.expires_at = time.monotonic() + (ttl or self.ttl)
+
+    def discard(self, user_id, game_type=None):
+        """Buang sesi user (kalo game_type diisi, cuma kalo jenisnya cocok)."""
+        session = self._sessions.get(user_id)
+        if session is None or (game_type is not None and session.game_type != game_type):
+            return None
+        return self._remove(user_id)
+
+    def discard_timed_out(self, user_id, game_type):
+        """Dipanggil dari on_timeout view: sesinya ditinggal user."""
+        if self.discard(user_id, game_type) is not None:
+            self.timed_out_count += 1
+
+    def _remove(self, user_id):
+        session = self._sessions.pop(user_id, None)
+        if session is None:
+            return None
+        if session.channel is not None:
+            self._by_channel.pop((session.channel.id, user_id), None)
+        if session.timer is not None:
+            session.timer.cancel()
+            session.timer = None
+        session.awaiting = False
+        return session
+
+    def sweep(self):
+        now = time.monotonic()
+        expired = [user_id for user_id, session in self._sessions.items() if session.expires_at <= now]
+        for user_id in expired:
+            self._remove(user_id)
+        self.expired_count += len(expired)
+        return len(expired)
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "quizzes": len(self._by_channel),
+            "expired": self.expired_count,
+            "timed_out": self.timed_out_count,
+        }
+
+    def start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            evicted = self.sweep()
+            if evicted:
+                print(f"Sweeper game: {evicted} sesi kadaluarsa dibuang, sisa {len(self._sessions)}.")
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+game_states = GameSessionStore()
+metrics.gauge("game_sessions", lambda: len(game_states))
+metrics.gauge("game_sessions_expired_total", lambda: game_states.expired_count)
+metrics.gauge("game_sessions_timed_out_total", lambda: game_states.timed_out_count)
 
 # --- FUNGSI UNTUK MENGELOLA SKOR ---
 
 def load_scores():
-    """Memuat skor dari file scores.json."""
+    """Memuat skor dari file scores.json (format lama)."""
     if not os.path.exists(SCORE_FILE):
         return {}
     try:
@@ -88,52 +848,341 @@ def load_scores():
     except json.JSONDecodeError:
         return {}
 
-def save_scores(scores):
-    """Menyimpan skor ke file scores.json."""
-    with open(SCORE_FILE, 'w') as f:
-        json.dump(scores, f, indent=4)
+def _top_order(item):
+    """Urutan papan skor: menang terbanyak dulu, kalo seri yang ID-nya lebih kecil."""
+    return (-item[0], item[1])
+
+class ScoreStore:
+    """Skor kuis per server di memori, disimpen ke SQLite (mode WAL) tiap beberapa detik dalam satu transaksi."""
+    def __init__(self, path=SCORE_DB_FILE, flush_interval=SCORE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._scores = {}      # guild_id -> {user_id: jumlah menang}
+        self._totals = {}      # user_id -> jumlah menang di semua server
+        self._top = {}         # guild_id -> [(menang, user_id)] urut dari yang paling gede, maks LEADERBOARD_SIZE
+        self._top_global = []
+        self._dirty = set()    # (guild_id, user_id) yang belom ditulis ke disk
+        self._conn = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="scores")
+        self._flush_task = None
+
+    def start(self):
+        """Buka database dan muat semua skor ke memori (dipanggil sekali dari main())."""
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, wins INTEGER NOT NULL, "
+            "PRIMARY KEY (guild_id, user_id))"
+        )
+        for guild_id, user_id, wins in self._conn.execute("SELECT guild_id, user_id, wins FROM scores"):
+            self._scores.setdefault(guild_id, {})[user_id] = wins
+        if not self._scores:
+            self._import_legacy()
+        self._rebuild_index()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def _import_legacy(self):
+        legacy = load_scores()
+        if not legacy:
+            return
+        rows = [(LEGACY_SCORE_GUILD, int(user_id), wins) for user_id, wins in legacy.items()]
+        for guild_id, user_id, wins in rows:
+            self._scores.setdefault(guild_id, {})[user_id] = wins
+        self._write(rows)
+        print(f"{len(rows)} skor lama dari {SCORE_FILE} dipindahin ke {self.path}.")
+
+    def _rebuild_index(self):
+        self._totals = {}
+        self._top = {}
+        for guild_id, guild_scores in self._scores.items():
+            for user_id, wins in guild_scores.items():
+                self._totals[user_id] = self._totals.get(user_id, 0) + wins
+            self._top[guild_id] = self._top_of(guild_scores)
+        self._top_global = self._top_of(self._totals)
+
+    @staticmethod
+    def _top_of(scores):
+        return heapq.nsmallest(LEADERBOARD_SIZE, ((wins, user_id) for user_id, wins in scores.items()), key=_top_order)
+
+    @staticmethod
+    def _bump_top(top, user_id, wins):
+        """Update daftar top-N. Skor cuma bisa naik, jadi yang di luar daftar cuma bisa masuk lewat skornya sendiri."""
+        for i, (_, top_user_id) in enumerate(top):
+            if top_user_id == user_id:
+                del top[i]
+                break
+        else:
+            if len(top) >= LEADERBOARD_SIZE and _top_order((wins, user_id)) >= _top_order(top[-1]):
+                return   # Dibandingin pake kunci lengkap biar yang seri urutannya sama kayak _rebuild_index
+        bisect.insort(top, (wins, user_id), key=_top_order)
+        del top[LEADERBOARD_SIZE:]
+
+    def add_win(self, guild_id, user_id):
+        """Nambahin 1 kemenangan, balikin total barunya. Cuma nyentuh memori, disk-nya nyusul."""
+        guild_id = guild_id or LEGACY_SCORE_GUILD
+        guild_scores = self._scores.setdefault(guild_id, {})
+        wins = guild_scores[user_id] = guild_scores.get(user_id, 0) + 1
+        total = self._totals[user_id] = self._totals.get(user_id, 0) + 1
+        self._bump_top(self._top.setdefault(guild_id, []), user_id, wins)
+        self._bump_top(self._top_global, user_id, total)
+        self._dirty.add((guild_id, user_id))
+        return wins
+
+    def get(self, guild_id, user_id):
+        return self._scores.get(guild_id or LEGACY_SCORE_GUILD, {}).get(user_id, 0)
+
+    def guild_scores(self, guild_id):
+        """Skor satu server (jangan diubah langsung)."""
+        return self._scores.get(guild_id or LEGACY_SCORE_GUILD, {})
+
+    def global_scores(self):
+        """Total kemenangan tiap pemain di semua server (jangan diubah langsung)."""
+        return self._totals
+
+    def top(self, guild_id, n=LEADERBOARD_SIZE):
+        """Pemain teratas di satu server: [(user_id, menang)], udah urut."""
+        return [(user_id, wins) for wins, user_id in self._top.get(guild_id or LEGACY_SCORE_GUILD, [])[:n]]
+
+    def top_global(self, n=LEADERBOARD_SIZE):
+        return [(user_id, wins) for wins, user_id in self._top_global[:n]]
+
+    async def shared_top_global(self, n=LEADERBOARD_SIZE):
+        """Papan skor global langsung dari database, biar skor dari proses worker lain ikut keitung (mode cluster)."""
+        await self.flush()
+        loop = asyncio.get_running_loop()
+
+        def _query():
+            return self._conn.execute(
+                "SELECT user_id, SUM(wins) AS total FROM scores GROUP BY user_id ORDER BY total DESC, user_id LIMIT ?", (n,)
+            ).fetchall()
+        return await loop.run_in_executor(self._executor, _query)
+
+    def _write(self, rows):
+        with self._conn:   # Satu transaksi: ketulis semua atau gak sama sekali
+            self._conn.executemany(
+                "INSERT INTO scores (guild_id, user_id, wins) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id, user_id) DO UPDATE SET wins = excluded.wins",
+                rows,
+            )
+
+    async def flush(self):
+        if not self._dirty or self._conn is None:
+            return
+        keys, self._dirty = self._dirty, set()
+        rows = [(guild_id, user_id, self._scores[guild_id][user_id]) for guild_id, user_id in keys]
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write, rows)
+        except Exception as e:
+            self._dirty |= keys   # Coba lagi di flush berikutnya
+            print(f"Gagal nyimpen skor: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if self._conn is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+score_store = ScoreStore()
 
 # --- EVENT & COMMANDS ---
 
+warm_up_task = None
+gateway_started = BOOT_STARTED
+
 @bot.event
 async def on_ready():
+    global warm_up_task
     print(f"Bot telah masuk sebagai {bot.user}")
     print("Bot siap menerima perintah!")
+    if warm_up_task is None:   # on_ready bisa kepanggil lagi tiap reconnect
+        record_phase("login + gateway (sampe on_ready)", gateway_started)
+        warm_up_task = asyncio.create_task(warm_up())
+
+async def warm_up():
+    """Nyiapin subsistem yang berat di background setelah bot udah online."""
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, ensure_cookie_file)
+    results = await asyncio.gather(extraction_pool.warm_up(), spotify.warm_up(), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Warm-up gagal: {result}")
+    record_phase("warm-up (yt-dlp, spotify, cookies)", started)
+    print(startup_report())
 
 # --- FUNGSI & KELAS UNTUK GAME (KODE LAMA LU, AMAN) ---
 
+# --- STOK PERTANYAAN KUIS (DIBIKIN DULUAN DI BACKGROUND) ---
+QUIZ_LANGUAGES = ("Bahasa Indonesia", "English")
+QUIZ_QUESTION_COUNT = 5
+QUIZ_CANDIDATE_COUNT = 8                                                   # Minta lebih biar masih kebagian 5 setelah yang dobel dibuang
+QUIZ_POOL_SIZE = int(os.getenv("QUIZ_POOL_SIZE", "6"))                     # Set kuis siap pakai per bahasa
+QUIZ_POOL_LOW_WATER = int(os.getenv("QUIZ_POOL_LOW_WATER", "2"))           # Mulai ngisi lagi kalo sisa segini
+QUIZ_POOL_REFILL_DELAY = float(os.getenv("QUIZ_POOL_REFILL_DELAY", "5"))   # Jeda antar panggilan Gemini pas ngisi
+QUIZ_SET_MAX_AGE = 6 * 3600                                                # Set yang kelamaan nganggur dibuang
+QUIZ_RECENT_QUESTIONS = 300                                                # Pertanyaan yang baru keluar gak boleh muncul lagi
+QUIZ_POOL_KEY = "quiz-pool"                                                # "Guild" buat jatah konkurensi Gemini si produser
+
+def quiz_prompt(language, count=QUIZ_QUESTION_COUNT):
+    return (
+        f"Buatkan {count} pertanyaan pengetahuan umum dari kategori (Geografi, Sejarah, Sains, Teknologi, dan Sastra) dalam {language} yang singkat dan padat. "
+        "Berikan jawaban yang singkat juga (satu atau dua kata). "
+        "Format output harus berupa JSON array dari objek, di mana setiap objek punya key 'q' untuk pertanyaan dan 'a' untuk jawaban. "
+        "Jawaban harus dalam huruf kecil semua. Contoh: [{'q': 'Ibu kota Perancis?', 'a': 'paris'}]"
+    )
+
+def parse_quiz_questions(text):
+    """Ubah jawaban Gemini jadi list {'q', 'a'} yang valid. Lempar ValueError kalo isinya kurang."""
+    json_text = text.strip().replace("```json", "").replace("```", "")
+    raw = json.loads(json_text)
+    questions = []
+    for item in raw if isinstance(raw, list) else []:
+        if not isinstance(item, dict):
+            continue
+        q, a = item.get('q'), item.get('a')
+        if isinstance(q, str) and isinstance(a, str) and q.strip() and a.strip():
+            questions.append({'q': q.strip(), 'a': a.strip().lower()})
+    if len(questions) < QUIZ_QUESTION_COUNT:
+        raise ValueError(f"Cuma dapet {len(questions)} pertanyaan yang valid")
+    return questions
+
+def _question_key(question):
+    return " ".join(question['q'].lower().split())
+
+class QuizPool:
+    """Stok set kuis per bahasa yang diisi pelan-pelan di background, biar mulai kuis tinggal ambil dari memori."""
+    def __init__(self, languages=QUIZ_LANGUAGES, size=QUIZ_POOL_SIZE, low_water=QUIZ_POOL_LOW_WATER,
+                 refill_delay=QUIZ_POOL_REFILL_DELAY):
+        self.languages = languages
+        self.size = size
+        self.low_water = low_water
+        self.refill_delay = refill_delay
+        self._sets = {language: collections.deque() for language in languages}             # (dibikin_pada, pertanyaan)
+        self._recent = {language: collections.OrderedDict() for language in languages}     # pertanyaan yang baru keluar
+        self._refilling = set(languages)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None and GEMINI_API_KEY:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def available(self, language):
+        return len(self._sets[language])
+
+    def _evict_stale(self):
+        cutoff = time.monotonic() - QUIZ_SET_MAX_AGE
+        for language, sets in self._sets.items():
+            while sets and sets[0][0] < cutoff:
+                sets.popleft()
+            if len(sets) < self.low_water:
+                self._refilling.add(language)
+
+    def _known_keys(self, language):
+        keys = set(self._recent[language])
+        for _, questions in self._sets[language]:
+            keys.update(_question_key(q) for q in questions)
+        return keys
+
+    def _mark_served(self, language, questions):
+        recent = self._recent[language]
+        for question in questions:
+            recent[_question_key(question)] = None
+            recent.move_to_end(_question_key(question))
+        while len(recent) > QUIZ_RECENT_QUESTIONS:
+            recent.popitem(last=False)
+
+    async def _generate(self, language, guild_id=QUIZ_POOL_KEY, strict=True):
+        data = await gemini_client.generate(quiz_prompt(language, QUIZ_CANDIDATE_COUNT), guild_id=guild_id)
+        candidates = parse_quiz_questions(gemini_text(data))
+        seen = self._known_keys(language)
+        fresh = []
+        for question in candidates:
+            key = _question_key(question)
+            if key not in seen:
+                seen.add(key)
+                fresh.append(question)
+        if len(fresh) < QUIZ_QUESTION_COUNT:
+            if strict:
+                return None
+            fresh = candidates
+        return fresh[:QUIZ_QUESTION_COUNT]
+
+    async def take(self, language, guild_id=None):
+        """Ambil satu set kuis. Kalo stoknya lagi kosong, bikin langsung saat itu juga."""
+        self._evict_stale()
+        sets = self._sets[language]
+        questions = sets.popleft()[1] if sets else None
+        if len(sets) < self.low_water:
+            self._refilling.add(language)
+            self._wakeup.set()
+        if questions is None:
+            questions = await self._generate(language, guild_id=guild_id, strict=False)
+        self._mark_served(language, questions)
+        return questions
+
+    async def _run(self):
+        while True:
+            self._evict_stale()
+            for language in list(self._refilling):
+                if len(self._sets[language]) >= self.size:
+                    self._refilling.discard(language)
+            if not self._refilling:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=QUIZ_SET_MAX_AGE / 4)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            language = min(self._refilling, key=lambda lang: len(self._sets[lang]))   # Yang paling tipis duluan
+            try:
+                questions = await self._generate(language)
+                if questions:
+                    self._sets[language].append((time.monotonic(), questions))
+            except Exception as e:
+                print(f"Gagal ngisi stok kuis {language}: {e}")
+                await asyncio.sleep(30)
+                continue
+            await asyncio.sleep(self.refill_delay)
+
+quiz_pool = QuizPool()
+
 async def generate_and_start_quiz(interaction: discord.Interaction, language: str):
-    author_id = interaction.user.id
     await interaction.response.edit_message(content=f"Oke, si kakek lagi mikirin pertanyaan dalam {language}... Bentar ya...", embed=None, view=None)
 
-    if not GEMINI_API_KEY:
+    if not GEMINI_API_KEY and not quiz_pool.available(language):
         await interaction.channel.send("Waduh, API Key buat bikin pertanyaan belom diatur nih. Kuis gagal dimulai.")
         return
 
-    API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={GEMINI_API_KEY}"
-    prompt = (
-        f"Buatkan 5 pertanyaan pengetahuan umum dari kategori (Geografi, Sejarah, Sains, Teknologi, dan Sastra) dalam {language} yang singkat dan padat. "
-        "Berikan jawaban yang singkat juga (satu atau dua kata). "
-        "Format output harus berupa JSON array dari objek, di mana setiap objek punya key 'q' untuk pertanyaan dan 'a' untuk jawaban. "
-        "Jawaban harus dalam huruf kecil semua. Contoh: [{'q': 'Ibu kota Perancis?', 'a': 'paris'}]"
-    )
-    payload = {"contents": [{"parts":[{"text": prompt}]}]}
-
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(API_URL, json=payload) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    json_text = data['candidates'][0]['content']['parts'][0]['text'].strip().replace("```json", "").replace("```", "")
-                    questions = json.loads(json_text)
-
-                    game_states[author_id] = {"game_type": "quiz", "score": 0, "questions": questions, "current_q": 0}
-                    embed = discord.Embed(title="Kuis dari Kakek Dimulai!", description="Jawab 5 pertanyaan di bawah ini secepatnya!", color=discord.Color.gold())
-                    await interaction.channel.send(embed=embed)
-                    await ask_quiz_question(interaction.channel, interaction.user)
-                else:
-                    error_text = await response.text()
-                    await interaction.channel.send(f"Waduh, si kakek lagi pusing, gagal bikin pertanyaan. Coba lagi nanti. Error: {response.status}\n`{error_text}`")
+        questions = await quiz_pool.take(language, guild_id=interaction.guild_id)
+
+        embed = discord.Embed(title="Kuis dari Kakek Dimulai!", description="Jawab 5 pertanyaan di bawah ini secepatnya!", color=discord.Color.gold())
+        await interaction.channel.send(embed=embed)
+        await start_quiz(interaction.channel, interaction.user, questions)
+    except GeminiError as e:
+        await interaction.channel.send(f"Waduh, si kakek lagi pusing, gagal bikin pertanyaan. Coba lagi nanti. Error: {e.status}\n`{e.text}`")
     except Exception as e:
         await interaction.channel.send(f"Anjir, error bray! Gagal nyambung ke otak si kakek. Coba lagi ntar.\nDetail: `{e}`")
 
@@ -148,12 +1197,17 @@ class LanguageSelectionView(discord.ui.View):
             return False
         return True
 
+    async def on_timeout(self):
+        game_states.discard_timed_out(self.author_id, "adventure")
+
     @discord.ui.button(label="Bahasa Indonesia", style=discord.ButtonStyle.primary, emoji="🇮🇩")
     async def select_indonesian(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()   # Udah dipilih, jangan sampe on_timeout ikut jalan
         await generate_and_start_quiz(interaction, "Bahasa Indonesia")
 
     @discord.ui.button(label="English", style=discord.ButtonStyle.secondary, emoji="🇬🇧")
     async def select_english(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
         await generate_and_start_quiz(interaction, "English")
 
 class AdventureStartView(discord.ui.View):
@@ -167,14 +1221,19 @@ class AdventureStartView(discord.ui.View):
             return False
         return True
 
+    async def on_timeout(self):
+        game_states.discard_timed_out(self.author_id, "adventure")
+
     @discord.ui.button(label="Masuk Hutan", style=discord.ButtonStyle.danger, emoji="🌳")
     async def go_to_forest(self, interaction: discord.Interaction, button: discord.ui.Button):
-        game_states[self.author_id] = {"game_type": "adventure"}
+        self.stop()
+        game_states.start(self.author_id, "adventure")
         embed = discord.Embed(title="Masuk ke Hutan Gelap", description="Lu milih masuk ke hutan. Suasananya serem, banyak suara aneh. Tiba-tiba dari balik semak muncul seekor beruang gede lagi marah!", color=discord.Color.dark_green())
         await interaction.response.edit_message(content=None, embed=embed, view=BearEncounterView(self.author_id))
 
     @discord.ui.button(label="Pergi ke Desa", style=discord.ButtonStyle.success, emoji="🏘️")
     async def go_to_village(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
         embed = discord.Embed(title="Menuju Desa...", description="Lu milih jalan ke desa dan ketemu seorang kakek. Sebelum ngasih pertanyaan, dia nanya lu mau kuisnya pake bahasa apa?", color=discord.Color.gold())
         await interaction.response.edit_message(content=None, embed=embed, view=LanguageSelectionView(self.author_id))
 
@@ -189,71 +1248,98 @@ class BearEncounterView(discord.ui.View):
             return False
         return True
 
+    async def on_timeout(self):
+        game_states.discard_timed_out(self.author_id, "adventure")
+
     @discord.ui.button(label="Lawan Beruang", style=discord.ButtonStyle.primary, emoji="⚔️")
     async def fight_bear(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
         embed = discord.Embed(title="KALAH TELAK!", description="Lu nekat ngelawan beruang pake tangan kosong. Ya jelas aja lu dicabik-cabik. Petualangan lu berakhir tragis.", color=discord.Color.red())
         await interaction.response.edit_message(content=None, embed=embed, view=None)
         await interaction.followup.send(random.choice(FIGHT_GIFS))
-        if self.author_id in game_states:
-            del game_states[self.author_id]
+        game_states.discard(self.author_id, "adventure")
 
     @discord.ui.button(label="Kabur!", style=discord.ButtonStyle.secondary, emoji="🏃")
     async def run_from_bear(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
         embed = discord.Embed(title="SELAMAT!", description="Lu lari sekenceng-kencengnya dan berhasil lolos dari beruang. Lu aman, tapi sekarang lu nyasar di dalem hutan. Petualangan lu berakhir di sini.", color=discord.Color.light_grey())
         await interaction.response.edit_message(content=None, embed=embed, view=None)
         await interaction.followup.send(random.choice(RUN_GIFS))
-        if self.author_id in game_states:
-            del game_states[self.author_id]
+        game_states.discard(self.author_id, "adventure")
+
+# --- MESIN KUIS (SATU DISPATCHER BUAT SEMUA KUIS YANG JALAN) ---
+QUIZ_ANSWER_TIMEOUT = 30.0
+
+async def start_quiz(channel, user, questions):
+    state = game_states.start(user.id, "quiz", channel=channel, user=user)
+    state.questions = questions
+    await ask_quiz_question(channel, user)
+
+def end_quiz(user_id):
+    game_states.discard(user_id, "quiz")
 
 async def ask_quiz_question(channel, user):
     state = game_states.get(user.id)
     if not state:
         return
 
-    if state["current_q"] >= len(state["questions"]):
-        score = state['score']
+    if state.current_q >= len(state.questions):
+        score = state.score
         passing_score = 3
 
         if score >= passing_score:
-            scores = load_scores()
-            user_id_str = str(user.id)
-            scores[user_id_str] = scores.get(user_id_str, 0) + 1
-            save_scores(scores)
+            guild = getattr(channel, 'guild', None)
+            score_store.add_win(guild.id if guild else None, user.id)
             
             embed = discord.Embed(title="Kuis Selesai! Lu Menang!", description=f"Mantep! Lu berhasil jawab {score} dari 5 pertanyaan dengan bener.\n**Skor lu nambah 1!**", color=discord.Color.green())
-            await channel.send(embed=embed)
-            await channel.send(random.choice(WIN_GIFS))
+            outbox.post(channel, embed=embed)
+            outbox.post(channel, random.choice(WIN_GIFS))
         else:
             embed = discord.Embed(title="Kuis Selesai! Lu Kalah!", description=f"Yah, lu cuma bener {score} dari 5. Coba lagi lain kali!", color=discord.Color.dark_red())
-            await channel.send(embed=embed)
-            await channel.send(random.choice(FAIL_GIFS))
+            outbox.post(channel, embed=embed)
+            outbox.post(channel, random.choice(FAIL_GIFS))
             
-        if user.id in game_states:
-            del game_states[user.id]
+        end_quiz(user.id)
         return
 
-    question_data = state["questions"][state["current_q"]]
-    q_embed = discord.Embed(title=f"Pertanyaan #{state['current_q'] + 1}", description=question_data["q"], color=discord.Color.orange())
-    await channel.send(embed=q_embed)
-
-    def check(m):
-        return m.author.id == user.id and m.channel.id == channel.id
-
-    try:
-        msg = await bot.wait_for('message', timeout=30.0, check=check)
-        if msg.content.lower().strip() == question_data["a"].lower().strip():
-            await channel.send("Jawaban lu bener! 👍")
-            state["score"] += 1
-        else:
-            await channel.send(f"Salah, bray! Jawaban yang bener itu: **{question_data['a']}**")
-        
-        state["current_q"] += 1
-        await ask_quiz_question(channel, user)
+    question_data = state.questions[state.current_q]
+    q_embed = discord.Embed(title=f"Pertanyaan #{state.current_q + 1}", description=question_data["q"], color=discord.Color.orange())
+    outbox.post(channel, embed=q_embed)   # Nyatu sama hasil jawaban sebelumnya jadi satu pesan
+
+    # Gak pake bot.wait_for: jawabannya ditangkep quiz_dispatcher, waktu abisnya diurus loop.call_later
+    if game_states.get(user.id) is state:
+        game_states.touch(state, QUIZ_ANSWER_TIMEOUT + GAME_SWEEP_INTERVAL)
+        state.awaiting = True
+        state.timer = asyncio.get_running_loop().call_later(QUIZ_ANSWER_TIMEOUT, _quiz_timed_out, state)
+
+def _quiz_timed_out(state):
+    if state.awaiting and game_states.get(state.user.id) is state:
+        state.awaiting = False
+        _expire_quiz(state)
+
+def _expire_quiz(state):
+    end_quiz(state.user.id)
+    outbox.post(state.channel, "Waktu abis, bray! Kuis dibatalin.")
+
+@bot.listen("on_message")
+async def quiz_dispatcher(message):
+    state = game_states.find(message.channel.id, message.author.id)
+    if state is None or not state.awaiting:
+        return
+    state.awaiting = False
+    state.timer.cancel()
+    state.timer = None
+
+    channel = state.channel
+    question_data = state.questions[state.current_q]
+    if message.content.lower().strip() == question_data["a"].lower().strip():
+        outbox.post(channel, "Jawaban lu bener! 👍")
+        state.score += 1
+    else:
+        outbox.post(channel, f"Salah, bray! Jawaban yang bener itu: **{question_data['a']}**")
 
-    except asyncio.TimeoutError:
-        await channel.send("Waktu abis, bray! Kuis dibatalin.")
-        if user.id in game_states:
-            del game_states[user.id]
+    state.current_q += 1
+    await ask_quiz_question(channel, state.user)
 
 @bot.command(name="quiz")
 async def adventure_start(ctx):
@@ -266,26 +1352,63 @@ async def adventure_start(ctx):
     view = AdventureStartView(ctx.author.id)
     await ctx.send(embed=embed, view=view)
 
+user_name_cache = {}   # user_id -> (kadaluarsa, nama) buat user yang gak ada di cache discord.py
+
+async def resolve_user_names(guild, user_ids):
+    """Nama buat tiap user_id: dari cache member/user dulu, terus cache TTL, sisanya di-fetch barengan."""
+    names = {}
+    misses = []
+    now = time.monotonic()
+    for user_id in user_ids:
+        member = guild.get_member(user_id) if guild else None
+        user = member or bot.get_user(user_id)
+        if user is not None:
+            names[user_id] = user.display_name
+            continue
+        cached = user_name_cache.get(user_id)
+        if cached is not None and cached[0] > now:
+            names[user_id] = cached[1]
+            continue
+        misses.append(user_id)
+
+    results = await asyncio.gather(*(bot.fetch_user(user_id) for user_id in misses), return_exceptions=True)
+    if len(user_name_cache) + len(misses) > USER_NAME_CACHE_MAX:
+        for user_id in [uid for uid, (expires_at, _) in user_name_cache.items() if expires_at <= now]:
+            del user_name_cache[user_id]
+    for user_id, result in zip(misses, results):
+        if isinstance(result, discord.NotFound):
+            names[user_id] = f"Pengguna Misterius (ID: {user_id})"
+        elif isinstance(result, Exception):
+            names[user_id] = f"Pengguna (ID: {user_id})"
+            continue
+        else:
+            names[user_id] = result.display_name
+        if len(user_name_cache) < USER_NAME_CACHE_MAX:
+            user_name_cache[user_id] = (now + USER_NAME_TTL, names[user_id])
+    return names
+
 @bot.command(name="skor")
-async def leaderboard(ctx):
-    """Menampilkan papan skor 10 pemain teratas."""
-    scores = load_scores()
-    if not scores:
+async def leaderboard(ctx, scope: str = None):
+    """Menampilkan papan skor 10 pemain teratas (di server ini, atau `!skor global`)."""
+    if scope == "global" or ctx.guild is None:
+        top_scores = await score_store.shared_top_global() if CLUSTER_ID else score_store.top_global()
+        description = "Ini dia para jagoan kuis dari semua server!"
+    else:
+        top_scores = score_store.top(ctx.guild.id)
+        description = "Ini dia para jagoan kuis di server!"
+        if not top_scores:
+            # Server ini belom punya skor sendiri: tampilin skor lama dari scores.json (sebelum dipisah per server)
+            top_scores = score_store.top(LEGACY_SCORE_GUILD)
+            description = "Server ini belom punya skor sendiri, jadi ini papan skor lama dulu ya!"
+    if not top_scores:
         await ctx.send("Belom ada yang punya skor, bray. Main gih sana!")
         return
 
-    sorted_scores = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    names = await resolve_user_names(ctx.guild, [user_id for user_id, _ in top_scores])
+    embed = discord.Embed(title="🏆 Papan Skor Kuis Teratas 🏆", description=description, color=discord.Color.gold())
 
-    embed = discord.Embed(title="🏆 Papan Skor Kuis Teratas 🏆", description="Ini dia para jagoan kuis di server!", color=discord.Color.gold())
-
-    for i, (user_id, score) in enumerate(sorted_scores[:10]):
-        try:
-            user = await bot.fetch_user(int(user_id))
-            user_name = user.display_name
-        except discord.NotFound:
-            user_name = f"Pengguna Misterius (ID: {user_id})"
-        
-        embed.add_field(name=f"#{i+1} - {user_name}", value=f"**{score}** kemenangan", inline=False)
+    for i, (user_id, score) in enumerate(top_scores):
+        embed.add_field(name=f"#{i+1} - {names[user_id]}", value=f"**{score}** kemenangan", inline=False)
 
     await ctx.send(embed=embed)
 
@@ -297,47 +1420,297 @@ async def serverinfo(ctx):
         embed.set_thumbnail(url=guild.icon.url)
     embed.add_field(name="Nama Server", value=guild.name, inline=True)
     embed.add_field(name="ID Server", value=guild.id, inline=True)
-    embed.add_field(name="Pemilik Server", value=guild.owner.mention, inline=False)
+    embed.add_field(name="Pemilik Server", value=guild.owner.mention if guild.owner else f"<@{guild.owner_id}>", inline=False)
     embed.add_field(name="Jumlah Anggota", value=guild.member_count, inline=True)
     embed.add_field(name="Jumlah Channel", value=len(guild.text_channels) + len(guild.voice_channels), inline=True)
     embed.add_field(name="Dibuat pada", value=guild.created_at.strftime("%d %B %Y, %H:%M"), inline=False)
     embed.set_footer(text=f"Diminta oleh: {ctx.author.name}", icon_url=ctx.author.avatar.url if ctx.author.avatar else "")
     await ctx.send(embed=embed)
 
+STREAM_EDIT_INTERVAL = 1.2   # Jarak minimal antar edit pesan biar gak kena rate limit
+
+class StreamingReply:
+    """Nampilin teks yang ngalir di satu pesan: edit-nya dibatesin, kalo nyentuh 2000 karakter lanjut ke pesan baru."""
+    def __init__(self, ctx, message, header, interval=STREAM_EDIT_INTERVAL):
+        self.ctx = ctx
+        self.message = message
+        self.interval = interval
+        self.buffer = header       # Isi lengkap pesan yang sekarang
+        self.started = False
+        self._shown = None         # Isi yang terakhir beneran ke-edit
+        self._last_edit = 0.0
+
+    async def feed(self, text):
+        self.started = True
+        self.buffer += text
+        while True:
+            if self.message is None:
+                # Sisa potongan yang isinya spasi/enter doang gak bisa dikirim, tunggu sampe ada teks beneran
+                self.buffer = self.buffer.lstrip()
+                if not self.buffer:
+                    return
+                self._shown = self.buffer[:DISCORD_MESSAGE_LIMIT]
+                self.message = await self.ctx.send(self._shown)
+                self._last_edit = time.monotonic()
+            if len(self.buffer) <= DISCORD_MESSAGE_LIMIT:
+                break
+            cut = self.buffer.rfind("\n", 0, DISCORD_MESSAGE_LIMIT)
+            if cut < DISCORD_MESSAGE_LIMIT // 2:
+                cut = DISCORD_MESSAGE_LIMIT
+            head, self.buffer = self.buffer[:cut], self.buffer[cut:]
+            await self._edit(head, force=True)
+            self.message = None   # Pesan ini udah penuh, sisanya masuk pesan baru
+        await self._edit(self.buffer)
+
+    async def finish(self):
+        if self.message is not None:
+            await self._edit(self.buffer, force=True)
+
+    async def _edit(self, content, force=False):
+        if content == self._shown or not content:
+            return
+        if not force and time.monotonic() - self._last_edit < self.interval:
+            return
+        await self.message.edit(content=content)
+        self._shown = content
+        self._last_edit = time.monotonic()
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.listen("on_command_completion")
+async def record_command_latency(ctx):
+    if hasattr(ctx, 'started_at'):
+        metrics.observe("command_latency_seconds", time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name)
+
+@bot.listen("on_command_error")
+async def record_command_error(ctx, error):
+    if ctx.command is not None:
+        metrics.inc("command_errors_total", command=ctx.command.qualified_name)
+        if hasattr(ctx, 'started_at'):
+            metrics.observe("command_latency_seconds", time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name)
+
+    # Begitu ada listener on_command_error, handler bawaan discord.py diem. Jadi log-nya ditulis di sini kayak aslinya.
+    if ctx.command is not None and ctx.command.has_error_handler():
+        return
+    if ctx.cog is not None and ctx.cog.has_error_handler():
+        return
+    print(f"Ignoring exception in command {ctx.command}:", file=sys.stderr)
+    traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+def _fmt_latency(histogram):
+    return f"p50 {histogram.quantile(0.5) * 1000:.0f}ms · p99 {histogram.quantile(0.99) * 1000:.0f}ms · n={histogram.count}"
+
+@bot.command(name="stats")
+@commands.is_owner()
+async def stats(ctx):
+    """Nampilin metrik performa bot (khusus yang punya bot)."""
+    gauges = metrics.read_gauges()
+    embed = discord.Embed(title="📊 Statistik Bot", color=discord.Color.teal())
+
+    commands_seen = sorted(
+        ((dict(labels)['command'], histogram) for (name, labels), histogram in metrics.histograms.items() if name == "command_latency_seconds"),
+        key=lambda item: item[1].count, reverse=True,
+    )
+    command_lines = [f"`!{command}` {_fmt_latency(histogram)}" for command, histogram in commands_seen[:10]]
+    embed.add_field(name="Latensi Perintah", value="\n".join(command_lines) or "Belom ada data.", inline=False)
+
+    embed.add_field(name="yt-dlp", value=f"{_fmt_latency(metrics.histogram('ytdl_extract_seconds'))}\nerror: {metrics.counter('ytdl_extract_errors_total')} · antrian: {gauges['ytdl_queue_depth']} · jalan: {gauges['ytdl_running']} · digabung: {metrics.counter('song_lookups_coalesced_total')}", inline=False)
+
+    gemini_lines = []
+    for method in ("generate", "stream"):
+        histogram = metrics.histogram("gemini_request_seconds", method=method)
+        errors = sum(value for (name, labels), value in metrics.counters.items() if name == "gemini_errors_total" and ('method', method) in labels)
+        error_rate = errors / histogram.count * 100 if histogram.count else 0.0
+        gemini_lines.append(f"{method}: {_fmt_latency(histogram)} · error {error_rate:.1f}%")
+    cache_line = " · ".join(f"{metrics.counter('answer_cache_total', result=result)} {result}" for result in ("hit", "miss", "coalesced"))
+    embed.add_field(name="Gemini", value="\n".join(gemini_lines) + f"\nretry: {metrics.counter('gemini_retries_total')}\ncache jawaban: {cache_line}", inline=False)
+
+    loop_lag = metrics.histogram("event_loop_lag_seconds")
+    embed.add_field(name="Event Loop", value=f"lag sekarang {metrics.loop_lag * 1000:.1f}ms · p99 {loop_lag.quantile(0.99) * 1000:.0f}ms", inline=False)
+    embed.add_field(name="Voice", value=f"{gauges['voice_clients']} koneksi · ~{gauges['ffmpeg_processes']} ffmpeg · {metrics.counter('voice_idle_disconnects_total')} dicabut karna sepi", inline=True)
+    embed.add_field(name="Musik", value=f"{gauges['music_queues']} antrian · {gauges['music_queued_tracks']} lagu\ncache lagu: {gauges['track_cache_hits_total']} hit · {gauges['track_cache_misses_total']} miss\ncache audio: {gauges['audio_cache_hits_total']} hit · {gauges['audio_cache_bytes'] / 1024 / 1024:.0f} MB", inline=True)
+    game = game_states.stats()
+    embed.add_field(name="Game", value=f"{game['sessions']} sesi ({game['quizzes']} kuis) · {game['expired']} kadaluarsa · {game['timed_out']} ditinggal", inline=True)
+    embed.add_field(name="Pesan Keluar", value=f"{metrics.counter('outbox_posts_total')} pesan status → {metrics.counter('outbox_messages_sent_total')} kiriman · {metrics.counter('now_playing_panel_edits_total')} edit panel", inline=False)
+    startup_lines = [f"{name}: {seconds * 1000:.0f}ms" for name, seconds in startup_phases]
+    embed.add_field(name="Startup", value="\n".join(startup_lines) or "Belom selesai.", inline=False)
+    await ctx.send(embed=embed)
+
+@stats.error
+async def stats_error(ctx, error):
+    if isinstance(error, commands.NotOwner):
+        await ctx.send("Ini khusus yang punya bot, bray.")
+    else:
+        await ctx.send(f"Anjir, ada error: `{error}`")
+
+# --- CACHE JAWABAN !tanya ---
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))   # Detik; 0 = gak usah di-cache (dedupe tetep jalan)
+ANSWER_CACHE_FILE = os.getenv("ANSWER_CACHE_FILE")               # Kosongin kalo gak mau disimpen ke disk
+
+def normalize_question(question):
+    """Kunci cache: huruf kecil, spasi dirapiin, tanda baca di ujung dibuang."""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+class AnswerCache:
+    """LRU + TTL buat jawaban Gemini, kuncinya teks pertanyaan yang udah dinormalisasi."""
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, path=ANSWER_CACHE_FILE):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._entries = collections.OrderedDict()   # kunci -> (expires_at, jawaban)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def put(self, key, answer):
+        if self.ttl <= 0 or not answer:
+            return
+        self._entries[key] = (time.time() + self.ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Gagal baca cache jawaban: {e}")
+            return
+        now = time.time()
+        for key, (expires_at, answer) in raw.items():
+            if expires_at > now:
+                self._entries[key] = (expires_at, answer)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Gagal nyimpen cache jawaban: {e}")
+
+answer_cache = AnswerCache()
+answer_cache.load()
+answer_lookups = {}   # kunci pertanyaan -> future jawaban yang lagi ditanyain ke Gemini
+metrics.gauge("answer_cache_entries", lambda: len(answer_cache))
+
+def _answer_lookup_done(key, future):
+    answer_lookups.pop(key, None)
+    if not future.cancelled():
+        future.exception()   # Ditandain udah diambil, biar gak ada warning kalo gak ada yang nebeng
+
+async def send_answer(ctx, header, answer):
+    if len(header) + len(answer) <= DISCORD_MESSAGE_LIMIT:
+        await ctx.send(header + answer)
+    else:
+        await ctx.send(header)
+        chunk_size = 1990
+        for i in range(0, len(answer), chunk_size):
+            await ctx.send(answer[i:i+chunk_size])
+
 @bot.command(name="tanya")
 async def ask_gemini(ctx, *, question: str):
     if not GEMINI_API_KEY:
         await ctx.send("Waduh, API Key buat ngobrol sama AI belom diatur nih sama yang punya bot.")
         return
+    header = f"**Pertanyaan lu:**\n> {question}\n\n**Jawaban dari gue:**\n"
+    key = normalize_question(question)
+    answer = answer_cache.get(key)
+    if answer is not None:
+        metrics.inc("answer_cache_total", result="hit")
+        await send_answer(ctx, header, answer)
+        return
+
     thinking_message = await ctx.send("Bentar ya, gue lagi mikir...")
-    API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={GEMINI_API_KEY}"
-    payload = {"contents": [{"parts":[{"text": question}]}]}
+    guild_id = ctx.guild.id if ctx.guild else None
+    reply = None
+    # Pertanyaan yang sama lagi ditanyain orang lain? Tungguin jawabannya aja, gak usah nanya dobel.
+    lookup = answer_lookups.get(key)
+    leader = lookup is None
+    if leader:
+        metrics.inc("answer_cache_total", result="miss")
+        lookup = answer_lookups[key] = asyncio.get_running_loop().create_future()
+        lookup.add_done_callback(functools.partial(_answer_lookup_done, key))
+    else:
+        metrics.inc("answer_cache_total", result="coalesced")
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(API_URL, json=payload) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    answer = data['candidates'][0]['content']['parts'][0]['text']
-                    await thinking_message.delete()
-                    header = f"**Pertanyaan lu:**\n> {question}\n\n**Jawaban dari gue:**\n"
-                    if len(header) + len(answer) <= 2000:
-                        await ctx.send(header + answer)
-                    else:
-                        await ctx.send(header)
-                        chunk_size = 1990
-                        for i in range(0, len(answer), chunk_size):
-                            await ctx.send(answer[i:i+chunk_size])
-                else:
-                    error_text = await response.text()
-                    await thinking_message.edit(content=f"Waduh, ada masalah pas nanya ke AI nih. Error: {response.status}\n`{error_text}`")
+        if not leader:
+            try:
+                answer = await asyncio.shield(lookup)
+            except asyncio.CancelledError:
+                if not lookup.cancelled():
+                    raise
+                raise RuntimeError("pertanyaan yang sama barusan dibatalin")
+            await thinking_message.delete()
+            await send_answer(ctx, header, answer)
+            return
+
+        if GEMINI_STREAMING:
+            reply = StreamingReply(ctx, thinking_message, header)
+            parts = []
+            async for text in gemini_client.stream(question, guild_id=guild_id):
+                parts.append(text)
+                await reply.feed(text)
+            answer = "".join(parts)
+            answer_cache.put(key, answer)
+            lookup.set_result(answer)
+            await reply.finish()
+            return
+
+        data = await gemini_client.generate(question, guild_id=guild_id)
+        answer = gemini_text(data)
+        answer_cache.put(key, answer)
+        lookup.set_result(answer)
+        await thinking_message.delete()
+        await send_answer(ctx, header, answer)
+    except GeminiError as e:
+        if leader and not lookup.done():
+            lookup.set_exception(e)
+        error_message = f"Waduh, ada masalah pas nanya ke AI nih. Error: {e.status}\n`{e.text}`"
+        if reply is not None and reply.started:
+            await ctx.send(error_message)
+        else:
+            await thinking_message.edit(content=error_message)
     except Exception as e:
-        await thinking_message.edit(content=f"Anjir, error bray! Gagal nyambung ke otaknya AI. Coba lagi ntar.\nDetail: `{e}`")
+        if leader and not lookup.done():
+            lookup.set_exception(e)
+        error_message = f"Anjir, error bray! Gagal nyambung ke otaknya AI. Coba lagi ntar.\nDetail: `{e}`"
+        if reply is not None and reply.started:
+            await reply.finish()
+            await ctx.send(error_message)
+        else:
+            await thinking_message.edit(content=error_message)
+    finally:
+        if leader and not lookup.done():
+            lookup.cancel()   # Command-nya di-cancel sebelum dapet jawaban
 
 # --- MODUL MUSIK ---
 
 # --- OPSI YTDL DI-UPDATE BIAR LEBIH RINGAN ---
 YTDL_OPTIONS = {
-    'format': 'worstaudio/best', # <-- GANTI JADI INI
+    'format': 'worstaudio[acodec=opus]/worstaudio/best', # <-- Opus duluan biar bisa langsung diterusin ke Discord
     'noplaylist': True,
     'default_search': 'auto',
     'quiet': True,
@@ -351,60 +1724,1028 @@ FFMPEG_OPTIONS = {
     'options': '-vn',
 }
 
-# Tempat nyimpen antrian lagu buat tiap server
+# Opus passthrough: ffmpeg ngirim Opus langsung, jadi discord.py gak perlu encode ulang dari PCM
+MUSIC_OPUS_PASSTHROUGH = os.getenv("MUSIC_OPUS_PASSTHROUGH", "1") != "0"
+
+def make_audio_source(song):
+    """Bikin source audio: file lokal dari cache kalo ada, stream Opus di-copy apa adanya, format lain di-encode ke Opus sama ffmpeg."""
+    local_path = audio_cache.lookup(song)
+    if local_path is not None:
+        if not MUSIC_OPUS_PASSTHROUGH:
+            return discord.FFmpegPCMAudio(local_path, options='-vn')
+        return discord.FFmpegOpusAudio(local_path, codec='copy', options='-vn')
+    if not MUSIC_OPUS_PASSTHROUGH:
+        return discord.FFmpegPCMAudio(song['url'], **FFMPEG_OPTIONS)
+    codec = 'copy' if song.get('acodec') == 'opus' else None
+    return discord.FFmpegOpusAudio(song['url'], codec=codec, **FFMPEG_OPTIONS)
+
+class Playlist:
+    """Antrian lagu satu server: tambah di belakang dan ambil di depan O(1), total durasi diitung sambil jalan.
+
+    Hapus/pindah pake nomer urut jalan di deque-nya langsung (gak pernah nge-copy
+    seluruh antrian). Lagu yang durasinya belom ketauan (belom di-resolve) diitung
+    di unknown_durations, nanti dibenerin lewat refresh() pas udah di-resolve.
+    """
+    def __init__(self):
+        self._songs = collections.deque()
+        self._counted = {}             # id(lagu) -> durasi yang udah masuk total_duration
+        self.total_duration = 0
+        self.unknown_durations = 0
+
+    def __len__(self):
+        return len(self._songs)
+
+    def __iter__(self):
+        return iter(self._songs)
+
+    def _count(self, song):
+        duration = song.get('duration') or 0
+        self._counted[id(song)] = duration
+        self.total_duration += duration
+        if not duration:
+            self.unknown_durations += 1
+
+    def _uncount(self, song):
+        duration = self._counted.pop(id(song))
+        self.total_duration -= duration
+        if not duration:
+            self.unknown_durations -= 1
+
+    def append(self, song):
+        self._songs.append(song)
+        self._count(song)
+
+    def popleft(self):
+        song = self._songs.popleft()
+        self._uncount(song)
+        return song
+
+    def peek(self):
+        return self._songs[0] if self._songs else None
+
+    def remove(self, index):
+        song = self._songs[index]
+        del self._songs[index]
+        self._uncount(song)
+        return song
+
+    def move(self, index, new_index):
+        song = self._songs[index]
+        del self._songs[index]
+        self._songs.insert(new_index, song)
+        return song
+
+    def shuffle(self):
+        songs = list(self._songs)
+        random.shuffle(songs)
+        self._songs = collections.deque(songs)
+
+    def clear(self):
+        self._songs.clear()
+        self._counted.clear()
+        self.total_duration = 0
+        self.unknown_durations = 0
+
+    def refresh(self, song):
+        """Itung ulang durasi lagu yang baru di-resolve (kalo lagunya masih ada di antrian)."""
+        if id(song) in self._counted:
+            self._uncount(song)
+            self._count(song)
+
+    def snapshot(self, start=0, count=None):
+        """Salinan sebagian antrian (buat ditampilin), cuma yang diminta doang yang di-copy."""
+        stop = None if count is None else start + count
+        return list(itertools.islice(self._songs, start, stop))
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+# Tempat nyimpen antrian lagu buat tiap server (guild_id -> Playlist)
 music_queues = {}
 
-# Fungsi buat ngambil info lagu pake yt-dlp (dijalanin di thread terpisah biar bot gak nge-freeze)
-async def get_song_info(query):
-    loop = asyncio.get_event_loop()
-    partial_func = functools.partial(yt_dlp.YoutubeDL(YTDL_OPTIONS).extract_info, query, download=False)
-    data = await loop.run_in_executor(None, partial_func)
-    
+# --- CACHE LAGU YANG UDAH DI-RESOLVE ---
+TRACK_CACHE_SIZE = int(os.getenv("TRACK_CACHE_SIZE", "512"))
+TRACK_CACHE_FILE = os.getenv("TRACK_CACHE_FILE")            # Kosongin kalo gak mau disimpen ke disk
+TRACK_CACHE_DEFAULT_TTL = 3600                               # Kalo URL-nya gak ada 'expire=', anggep awet sejam
+TRACK_CACHE_MARGIN = 600                                     # Buang 10 menit sebelum link googlevideo-nya mati
+TRACK_ID_CACHE_SIZE = int(os.getenv("TRACK_ID_CACHE_SIZE", "10000"))   # Query -> ID video, gak ikut mati bareng link stream
+YOUTUBE_ID_REGEX = re.compile(r"(?:youtu\.be/|youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/))([A-Za-z0-9_-]{11})")
+STREAM_EXPIRE_REGEX = re.compile(r"[?&/]expire[=/](\d+)")
+
+def normalize_query(query):
+    """Bikin kunci cache: ID video kalo link YouTube, selain itu teks kecil tanpa spasi dobel."""
+    match = YOUTUBE_ID_REGEX.search(query)
+    if match:
+        return f"yt:{match.group(1)}"
+    return " ".join(query.lower().split())
+
+def stream_expiry(url):
+    """Ngambil timestamp 'expire' dari URL stream googlevideo (atau default TTL)."""
+    match = STREAM_EXPIRE_REGEX.search(url)
+    if match:
+        return int(match.group(1))
+    return time.time() + TRACK_CACHE_DEFAULT_TTL
+
+class TrackCache:
+    """LRU buat hasil get_song_info, tiap entri kadaluarsa ngikutin 'expire=' di URL stream-nya.
+
+    Selain itu ada LRU kedua yang lebih gede: kunci query -> ID/judul/durasi video tanpa link.
+    Yang ini gak kadaluarsa, dipake buat nyari file di cache audio tanpa ekstraksi ulang.
+    """
+    def __init__(self, max_size=TRACK_CACHE_SIZE, path=TRACK_CACHE_FILE, max_known=TRACK_ID_CACHE_SIZE):
+        self.max_size = max_size
+        self.max_known = max_known
+        self.path = path
+        self._entries = collections.OrderedDict()   # kunci -> (expires_at, song)
+        self._known = collections.OrderedDict()     # kunci -> {'id', 'title', 'duration', 'acodec'}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, song = entry
+        if expires_at - TRACK_CACHE_MARGIN <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(song)
+
+    def put(self, keys, song):
+        expires_at = stream_expiry(song['url'])
+        for key in keys:
+            self._entries[key] = (expires_at, dict(song))
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        if song.get('id'):
+            self._remember(keys, {'id': song['id'], 'title': song['title'], 'duration': song.get('duration'), 'acodec': song.get('acodec')})
+
+    def _remember(self, keys, info):
+        for key in keys:
+            self._known[key] = info
+            self._known.move_to_end(key)
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    def known(self, key):
+        """ID/judul/durasi video yang pernah ketemu buat kunci ini (walaupun link stream-nya udah mati), atau None."""
+        info = self._known.get(key)
+        if info is None:
+            return None
+        self._known.move_to_end(key)
+        return dict(info)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Gagal baca cache lagu: {e}")
+            return
+        if not isinstance(raw.get("entries"), dict):
+            raw = {"entries": raw, "known": {}}   # Format lama: isinya entri doang
+        now = time.time()
+        for key, (expires_at, song) in raw["entries"].items():
+            if expires_at - TRACK_CACHE_MARGIN > now:
+                self._entries[key] = (expires_at, song)
+            if song.get('id'):
+                self._remember([key], {'id': song['id'], 'title': song['title'], 'duration': song.get('duration'), 'acodec': song.get('acodec')})
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        for key, info in raw.get("known", {}).items():
+            self._remember([key], info)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"   # Per proses, biar worker cluster gak nulis ke file sementara yang sama
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"entries": self._entries, "known": self._known}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Gagal nyimpen cache lagu: {e}")
+
+track_cache = TrackCache()
+track_cache.load()
+metrics.gauge("track_cache_hits_total", lambda: track_cache.hits)
+metrics.gauge("track_cache_misses_total", lambda: track_cache.misses)
+
+# --- POOL KHUSUS BUAT EKSTRAKSI YT-DLP ---
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "thread")                          # 'thread' atau 'process'
+EXTRACT_QUEUE_SIZE = int(os.getenv("EXTRACT_QUEUE_SIZE", "64"))             # Maksimal job yang nunggu + jalan
+EXTRACT_MAX_PENDING_PER_GUILD = int(os.getenv("EXTRACT_MAX_PENDING_PER_GUILD", "8"))
+EXTRACT_RECYCLE_AFTER = 200                                                 # Ganti instance YoutubeDL tiap sekian ekstraksi
+
+_ytdl_local = threading.local()
+yt_dlp = None   # Modulnya di-import belakangan lewat load_yt_dlp()
+
+def load_yt_dlp():
+    global yt_dlp
+    if yt_dlp is None:
+        import yt_dlp as module
+        yt_dlp = module
+    return yt_dlp
+
+def _ytdl_instance():
+    ydl = getattr(_ytdl_local, 'ydl', None)
+    if ydl is None or _ytdl_local.uses >= EXTRACT_RECYCLE_AFTER:
+        ensure_cookie_file()
+        ydl = _ytdl_local.ydl = load_yt_dlp().YoutubeDL(YTDL_OPTIONS)
+        _ytdl_local.uses = 0
+    return ydl
+
+def _ytdl_warm_up():
+    """Jalan di worker: siapin instance YoutubeDL-nya (gak balikin apa-apa biar aman di mode process)."""
+    _ytdl_instance()
+
+def _ytdl_extract(query):
+    """Jalan di worker: pake YoutubeDL yang udah anget, balikin info yang perlu aja (biar enteng di-pickle)."""
+    ydl = _ytdl_instance()
+    _ytdl_local.uses += 1
+    data = ydl.extract_info(query, download=False)
+
     if 'entries' in data:
         data = data['entries'][0]
-        
-    return {'url': data['url'], 'title': data['title']}
 
-# --- FUNGSI PLAY_NEXT YANG SUDAH DI-UPGRADE ---
-async def play_next(ctx):
+    return {
+        'url': data['url'],
+        'title': data['title'],
+        'id': data.get('id'),
+        'extractor_key': data.get('extractor_key'),
+        'duration': data.get('duration'),
+        'acodec': data.get('acodec'),
+    }
+
+class ExtractionPool:
+    """Executor khusus yt-dlp: antrian terbatas (backpressure) dan giliran round-robin antar server."""
+    def __init__(self, workers=EXTRACT_WORKERS, mode=EXTRACT_MODE, max_pending=EXTRACT_QUEUE_SIZE,
+                 max_pending_per_guild=EXTRACT_MAX_PENDING_PER_GUILD):
+        self.workers = workers
+        self.mode = mode
+        self.max_pending_per_guild = max_pending_per_guild
+        self._executor = None
+        self._slots = asyncio.Semaphore(max_pending)
+        self._guild_slots = GuildLimiter(max_pending_per_guild)
+        self._pending = collections.OrderedDict()   # guild_id -> deque[(query, future)]
+        self._running = 0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.mode == "process":
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ytdl")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def pending(self):
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    async def warm_up(self):
+        """Import yt_dlp dan siapin instance YoutubeDL di tiap worker sebelum ada yang minta lagu."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ytdl_warm_up) for _ in range(self.workers)))
+
+    async def extract(self, query, guild_id=None):
+        self.start()
+        async with self._guild_slots.hold(guild_id), self._slots:
+            fut = asyncio.get_running_loop().create_future()
+            self._pending.setdefault(guild_id, collections.deque()).append((query, fut))
+            self._dispatch()
+            return await fut
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._running < self.workers and self._pending:
+            guild_id, jobs = next(iter(self._pending.items()))
+            query, fut = jobs.popleft()
+            if jobs:
+                self._pending.move_to_end(guild_id)   # Gantian sama server lain
+            else:
+                del self._pending[guild_id]
+            if fut.done():
+                continue
+            self._running += 1
+            job = loop.run_in_executor(self._executor, _ytdl_extract, query)
+            job.add_done_callback(functools.partial(self._finished, fut, time.perf_counter()))
+
+    def _finished(self, fut, started, job):
+        self._running -= 1
+        metrics.observe("ytdl_extract_seconds", time.perf_counter() - started)
+        if job.cancelled() or job.exception() is not None:
+            metrics.inc("ytdl_extract_errors_total")
+        if not fut.done():
+            if job.cancelled():
+                fut.cancel()
+            elif job.exception() is not None:
+                fut.set_exception(job.exception())
+            else:
+                fut.set_result(job.result())
+        self._dispatch()
+
+extraction_pool = ExtractionPool()
+metrics.gauge("ytdl_queue_depth", lambda: extraction_pool.pending)
+metrics.gauge("ytdl_running", lambda: extraction_pool._running)
+
+# Fungsi buat ngambil info lagu pake yt-dlp (dijalanin di pool khusus biar bot gak nge-freeze)
+song_lookups = {}   # kunci query -> task ekstraksi yang lagi jalan (single-flight)
+metrics.gauge("song_lookups_in_flight", lambda: len(song_lookups))
+
+async def get_song_info(query, guild_id=None):
+    key = normalize_query(query)
+    song = track_cache.get(key)
+    if song is not None:
+        return song
+
+    # Query yang sama lagi di-resolve? Nebeng hasilnya aja, gak usah ekstraksi dobel.
+    lookup = song_lookups.get(key)
+    if lookup is not None:
+        metrics.inc("song_lookups_coalesced_total")
+    else:
+        lookup = song_lookups[key] = asyncio.create_task(_resolve_song(query, key, guild_id))
+        lookup.add_done_callback(functools.partial(_lookup_done, key))
+    # shield: kalo satu pemanggil di-cancel, yang lain tetep dapet hasilnya
+    return await asyncio.shield(lookup)
+
+def _lookup_done(key, task):
+    song_lookups.pop(key, None)
+    if not task.cancelled():
+        task.exception()   # Ditandain udah diambil, biar gak ada warning kalo semua penunggunya udah cabut
+
+async def _resolve_song(query, key, guild_id):
+    song = await shared_store.get(f"track:{key}")   # Mungkin udah di-resolve sama proses lain
+    if song is not None and stream_expiry(song['url']) - TRACK_CACHE_MARGIN > time.time():
+        track_cache.put([key], song)
+        return song
+
+    data = await extraction_pool.extract(query, guild_id=guild_id)
+
+    song = {'url': data['url'], 'title': data['title'], 'duration': data.get('duration'), 'acodec': data.get('acodec'), 'id': data.get('id')}
+    keys = [key]
+    if data.get('id') and data.get('extractor_key') == 'Youtube':
+        keys.append(f"yt:{data['id']}")
+    track_cache.put(keys, song)
+    for cache_key in keys:
+        shared_store.put_nowait(f"track:{cache_key}", song, expires_at=stream_expiry(song['url']))
+    return song
+
+# --- CACHE AUDIO DI DISK BUAT LAGU YANG SERING DIPUTER ---
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR")                                  # Kosongin buat matiin cache audio
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "1024"))               # Per proses: di cluster tiap worker punya jatah segini sendiri
+if AUDIO_CACHE_DIR and CLUSTER_ID:
+    # Tiap worker cluster.py pegang subfolder sendiri, biar gak saling hapus file .part / ngusir file worker lain
+    AUDIO_CACHE_DIR = os.path.join(AUDIO_CACHE_DIR, f"worker-{CLUSTER_ID}")
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv("AUDIO_CACHE_MIN_PLAYS", "2"))            # Baru di-cache kalo udah diputer segini kali
+AUDIO_CACHE_MAX_DURATION = 900                                                  # Mix berjam-jam gak usah di-cache
+AUDIO_CACHE_FILL_CONCURRENCY = 2
+AUDIO_CACHE_PLAY_COUNTS = 10000                                                 # Maksimal lagu yang dihitung jumlah putarnya
+
+class AudioCache:
+    """Cache file Opus lokal (LRU, dibatesin ukurannya). Diisi di background abis lagunya diputer beberapa kali.
+
+    Foldernya punya satu proses doang (di cluster tiap worker dapet subfolder sendiri), jadi batas
+    ukurannya juga per proses: total di disk bisa sampe jumlah worker x AUDIO_CACHE_MAX_MB.
+    """
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024, min_plays=AUDIO_CACHE_MIN_PLAYS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self._files = collections.OrderedDict()   # kunci -> ukuran file (byte), urut dari yang paling lama gak dipake
+        self._plays = collections.OrderedDict()   # kunci -> berapa kali diputer
+        self._filling = set()
+        self._fill_sem = asyncio.Semaphore(AUDIO_CACHE_FILL_CONCURRENCY)
+        self.total_bytes = 0
+        self.hits = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def load(self):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                os.remove(path)   # Sisa pengisian proses ini sebelum restart, gak ada yang lain yang nulis ke sini
+            elif name.endswith(".opus"):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-len(".opus")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._files[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def _key(song):
+        return re.sub(r"[^A-Za-z0-9_-]", "", song.get('id') or "") or None
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.opus")
+
+    def contains(self, song):
+        """Ada file lokal buat lagu ini? (Gak ngubah urutan LRU, beda sama lookup.)"""
+        if not self.enabled:
+            return False
+        key = self._key(song)
+        return key in self._files and os.path.exists(self._path(key))
+
+    def lookup(self, song):
+        """Path file lokal buat lagu ini, atau None kalo belom ada."""
+        if not self.enabled:
+            return None
+        key = self._key(song)
+        if key not in self._files:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.total_bytes -= self._files.pop(key)
+            return None
+        self._files.move_to_end(key)
+        os.utime(path)
+        self.hits += 1
+        return path
+
+    def record_play(self, song):
+        """Dipanggil tiap lagu mulai diputer; kalo udah cukup sering, file lokalnya diisi di background."""
+        if not self.enabled:
+            return
+        key = self._key(song)
+        if key is None or key in self._files or key in self._filling:
+            return
+        self._plays[key] = self._plays.get(key, 0) + 1
+        self._plays.move_to_end(key)
+        while len(self._plays) > AUDIO_CACHE_PLAY_COUNTS:
+            self._plays.popitem(last=False)
+        if self._plays[key] < self.min_plays or (song.get('duration') or 0) > AUDIO_CACHE_MAX_DURATION:
+            return
+        self._filling.add(key)
+        asyncio.create_task(self._fill(key, song['url'], song.get('acodec') == 'opus'))
+
+    async def _fill(self, key, url, is_opus):
+        final_path = self._path(key)
+        tmp_path = f"{final_path}.part"
+        try:
+            async with self._fill_sem:
+                codec_args = ['-c:a', 'copy'] if is_opus else ['-c:a', 'libopus', '-b:a', '96k']
+                proc = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+                    *shlex.split(FFMPEG_OPTIONS['before_options']), '-i', url,
+                    '-vn', *codec_args, '-f', 'opus', tmp_path,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+                )
+                if await proc.wait() != 0:
+                    raise RuntimeError(f"ffmpeg keluar dengan kode {proc.returncode}")
+            os.replace(tmp_path, final_path)
+            size = os.path.getsize(final_path)
+            self._files[key] = size
+            self.total_bytes += size
+            self._plays.pop(key, None)
+            self._evict()
+        except Exception as e:
+            print(f"Gagal nge-cache audio {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            self._filling.discard(key)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._files:
+            key, size = self._files.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+audio_cache = AudioCache()
+metrics.gauge("audio_cache_bytes", lambda: audio_cache.total_bytes)
+metrics.gauge("audio_cache_hits_total", lambda: audio_cache.hits)
+
+# --- PREFETCH LAGU BERIKUTNYA (BIAR GAK ADA JEDA) ---
+MUSIC_LOOKAHEAD = int(os.getenv("MUSIC_LOOKAHEAD", "1"))     # Berapa lagu di depan yang dicek link-nya
+MUSIC_MAX_LOOKAHEAD = 3
+PREFETCH_SPAWN_LEAD = 20                                     # Nyalain ffmpeg lagu berikutnya 20 detik sebelum lagu sekarang abis
+
+lookahead_depth = {}       # guild_id -> kedalaman lookahead (diatur lewat !lookahead)
+now_playing = {}           # guild_id -> lagu yang lagi diputer
+prefetched_sources = {}    # guild_id -> (lagu, source FFmpeg yang udah nyala)
+prefetch_tasks = {}        # guild_id -> task prefetch yang lagi jalan
+
+def count_ffmpeg_processes():
+    """Perkiraan jumlah proses ffmpeg: yang lagi muter, yang lagi mau mulai, yang udah disiapin, dan yang lagi ngisi cache."""
+    playing = sum(1 for vc in bot.voice_clients if vc.is_playing() or vc.is_paused())
+    starting = sum(1 for player in players.values() if player.starting)
+    return playing + starting + len(prefetched_sources) + len(audio_cache._filling)
+
+metrics.gauge("voice_clients", lambda: len(bot.voice_clients))
+metrics.gauge("ffmpeg_processes", count_ffmpeg_processes)
+metrics.gauge("music_queues", lambda: len(music_queues))
+metrics.gauge("music_queued_tracks", lambda: sum(len(queue) for queue in music_queues.values()))
+
+async def revalidate_song(song, guild_id=None):
+    """Resolve lagu yang belom punya link stream, atau yang link-nya bentar lagi mati (isinya diganti di tempat).
+
+    Kalo lagunya udah ada di cache audio lokal, gak usah ekstraksi: link stream-nya gak bakal kepake.
+    """
+    if song.get('url') and stream_expiry(song['url']) - TRACK_CACHE_MARGIN > time.time():
+        return song
+    known = song if song.get('id') else track_cache.known(normalize_query(song['query']))
+    if known is not None and audio_cache.contains(known):
+        fresh = known
+    else:
+        fresh = await get_song_info(song['query'], guild_id=guild_id)
+        song['url'] = fresh['url']
+    song.update(title=fresh['title'], duration=fresh.get('duration'), acodec=fresh.get('acodec'), id=fresh.get('id'))
+    queue = music_queues.get(guild_id)
+    if queue is not None:
+        queue.refresh(song)
+    return song
+
+def discard_prefetched(guild_id):
+    entry = prefetched_sources.pop(guild_id, None)
+    if entry is not None:
+        entry[1].cleanup()
+
+def take_prefetched(guild_id, song):
+    """Ambil source yang udah disiapin kalo emang buat lagu ini, selain itu dibuang."""
+    entry = prefetched_sources.pop(guild_id, None)
+    if entry is None:
+        return None
+    if entry[0] is song:
+        return entry[1]
+    entry[1].cleanup()
+    return None
+
+async def prefetch_upcoming(ctx):
     guild_id = ctx.guild.id
-    if not ctx.voice_client or not ctx.voice_client.is_connected():
-        if guild_id in music_queues:
-            del music_queues[guild_id] 
+    queue = music_queues.get(guild_id)
+    depth = lookahead_depth.get(guild_id, MUSIC_LOOKAHEAD)
+    if not depth or not queue:
         return
 
-    if ctx.voice_client.is_playing():
+    for song in queue.snapshot(0, depth):
+        await revalidate_song(song, guild_id)
+
+    current = now_playing.get(guild_id)
+    if current and current.get('duration'):
+        wait = current['duration'] - PREFETCH_SPAWN_LEAD - (time.monotonic() - current['started_at'])
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    if not queue or not ctx.voice_client or not ctx.voice_client.is_connected():
         return
+    upcoming = queue.peek()
+    entry = prefetched_sources.get(guild_id)
+    if entry is not None and entry[0] is upcoming:
+        return
+    await revalidate_song(upcoming, guild_id)
+    discard_prefetched(guild_id)
+    if ffmpeg_at_capacity():
+        return   # Slot ffmpeg-nya buat yang beneran muter dulu
+    prefetched_sources[guild_id] = (upcoming, make_audio_source(upcoming))
 
-    if guild_id in music_queues and not music_queues[guild_id].empty():
-        song = await music_queues[guild_id].get()
-        
-        def after_playing(error):
-            if error:
-                print(f"Anjir, error pas muter lagu: {error}")
-                coro = ctx.send(f"Waduh, ada error pas muter lagu, bray. Mungkin lagunya gak bisa diakses.\n`{error}`")
-            else:
-                print("Lagu selesai diputer.")
-            
-            fut = asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop)
+def schedule_prefetch(ctx):
+    guild_id = ctx.guild.id
+    task = prefetch_tasks.get(guild_id)
+    if task is not None and not task.done():
+        task.cancel()
+    prefetch_tasks[guild_id] = asyncio.create_task(prefetch_upcoming(ctx))
+    prefetch_tasks[guild_id].add_done_callback(_report_prefetch_error)
+
+def _report_prefetch_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Prefetch lagu gagal: {task.exception()}")
+
+def cancel_prefetch(guild_id):
+    task = prefetch_tasks.pop(guild_id, None)
+    if task is not None and not task.done():
+        task.cancel()
+    discard_prefetched(guild_id)
+
+# --- ENTRI ANTRIAN (LAZY) & PLAYLIST/ALBUM SPOTIFY ---
+SPOTIFY_URL_REGEX = re.compile(r"(https?://)?(www\.)?open\.spotify\.com/(intl-[a-z]+/)?(track|playlist|album)/([a-zA-Z0-9]+)")
+SPOTIFY_MAX_TRACKS = int(os.getenv("SPOTIFY_MAX_TRACKS", "500"))   # Batas lagu per playlist/album yang dimasukin
+
+ingest_tasks = {}   # guild_id -> set task yang lagi masukin playlist/album Spotify
+
+def make_queue_entry(query, title=None):
+    """Entri antrian cuma nyimpen query-nya; 'url' baru diisi pas lagunya di-resolve."""
+    return {'query': query, 'title': title or query, 'url': None}
+
+def spotify_queue_entry(track_name, artist_name):
+    return make_queue_entry(f"{track_name} {artist_name}", title=f"{track_name} - {artist_name}")
+
+async def ingest_spotify_collection(ctx, kind, spotify_id):
+    guild_id = ctx.guild.id
+    queue = music_queues[guild_id]
+    added = 0
+    offset = 0
+    try:
+        while added < SPOTIFY_MAX_TRACKS:
+            tracks, page_size, has_next = await spotify.collection_page(kind, spotify_id, offset)
+            if music_queues.get(guild_id) is not queue:
+                return   # Antriannya udah dibuang (bot keluar dari channel)
+            for track_name, artist_name in tracks:
+                queue.append(spotify_queue_entry(track_name, artist_name))
+                added += 1
+                if added >= SPOTIFY_MAX_TRACKS:
+                    break
+
+            # Gak usah nunggu semua halaman, langsung puter begitu ada lagu
+            if ctx.voice_client and ctx.voice_client.is_connected():
+                if not ctx.voice_client.is_playing() and not ctx.voice_client.is_paused():
+                    start_player(ctx)
+                else:
+                    schedule_prefetch(ctx)
+
+            if not has_next:
+                break
+            offset += page_size
+    except Exception as e:
+        outbox.post(ctx.channel, f"Waduh, gagal ngambil lagu dari {kind} Spotify itu. Error: `{e}`")
+        return
+    outbox.post(ctx.channel, f"✅ **{added}** lagu dari {kind} Spotify udah masuk antrian!")
+    refresh_panel(ctx.guild.id)
+
+def start_spotify_ingest(ctx, kind, spotify_id):
+    task = asyncio.create_task(ingest_spotify_collection(ctx, kind, spotify_id))
+    tasks = ingest_tasks.setdefault(ctx.guild.id, set())
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+def cancel_ingest(guild_id):
+    for task in ingest_tasks.pop(guild_id, set()):
+        task.cancel()
+
+# --- PLAYER PER SERVER (DIGERAKIN EVENT) ---
+VOICE_IDLE_TIMEOUT = int(os.getenv("VOICE_IDLE_TIMEOUT", "300"))   # Detik sepi sebelum bot keluar sendiri dari voice (0 = gak pernah)
+MUSIC_MAX_FFMPEG = int(os.getenv("MUSIC_MAX_FFMPEG", "0"))          # Batas proses ffmpeg sekaligus di proses ini (0 = gak dibatesin)
+MUSIC_MAX_CONSECUTIVE_FAILURES = 20                                 # Lagu gagal beruntun sebelum player nyerah (nunggu !play berikutnya)
+FFMPEG_WAIT_POLL = 5                                                # Cek ulang slot ffmpeg tiap segini detik kalo lagi nunggu
+
+players = {}   # guild_id -> GuildPlayer
+
+def ffmpeg_at_capacity():
+    return MUSIC_MAX_FFMPEG > 0 and count_ffmpeg_processes() >= MUSIC_MAX_FFMPEG
+
+def reset_music_state(guild_id):
+    """Buang antrian, prefetch, dan ingest Spotify punya server ini (abis bot keluar dari voice)."""
+    music_queues.pop(guild_id, None)
+    now_playing.pop(guild_id, None)
+    cancel_prefetch(guild_id)
+    cancel_ingest(guild_id)
+    drop_panel(guild_id)
+
+class GuildPlayer:
+    """Satu task per server yang ngurus pergantian lagu, dibangunin lewat event.
+
+    Callback `after` dari thread audio cuma nge-set event, gak nungguin apa-apa.
+    Semua kerjaan play_next jalan di task ini, jadi otomatis gak barengan. Kalo
+    gak ada yang diputer (atau gak ada yang dengerin) selama VOICE_IDLE_TIMEOUT,
+    bot keluar sendiri dari voice.
+    """
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.guild_id = ctx.guild.id
+        self.wake = asyncio.Event()
+        self.idle_since = None
+        self.waiting_for_ffmpeg = False
+        self.starting = False   # Lagi nyiapin lagu (slot ffmpeg-nya udah dipesen)
+        self._loop = asyncio.get_running_loop()
+        self.task = asyncio.create_task(self._run())
+
+    def notify(self, ctx=None):
+        if ctx is not None:
+            self.ctx = ctx   # "Lagi Muterin" dikirim ke channel perintah terakhir
+        self.wake.set()
+
+    def _track_finished(self):
+        self.wake.set()
+        for player in players.values():   # Satu ffmpeg baru aja berhenti, yang nunggu slot boleh nyoba lagi
+            if player.waiting_for_ffmpeg:
+                player.wake.set()
+
+    def _idle_remaining(self):
+        """Sisa detik sebelum dianggep kelamaan sepi, None kalo lagi gak sepi."""
+        voice_client = self.ctx.voice_client
+        busy = voice_client.is_playing() or voice_client.is_paused() or self.waiting_for_ffmpeg
+        listeners = [member for member in voice_client.channel.members if not member.bot]
+        if not VOICE_IDLE_TIMEOUT or (busy and listeners):
+            self.idle_since = None
+            return None
+        if self.idle_since is None:
+            self.idle_since = time.monotonic()
+        return self.idle_since + VOICE_IDLE_TIMEOUT - time.monotonic()
+
+    def _blocked_by_ffmpeg_cap(self):
+        queue = music_queues.get(self.guild_id)
+        if not queue or self.ctx.voice_client.is_playing() or self.ctx.voice_client.is_paused():
+            return False
+        entry = prefetched_sources.get(self.guild_id)
+        if entry is not None and entry[0] is queue.peek():
+            return False   # ffmpeg-nya udah nyala dari prefetch
+        return ffmpeg_at_capacity()
+
+    async def _run(self):
+        try:
+            while True:
+                self.wake.clear()
+                voice_client = self.ctx.voice_client
+                if not voice_client or not voice_client.is_connected():
+                    reset_music_state(self.guild_id)
+                    return
+
+                try:
+                    if self._blocked_by_ffmpeg_cap():
+                        if not self.waiting_for_ffmpeg:
+                            self.waiting_for_ffmpeg = True
+                            outbox.post(self.ctx.channel, "Lagi rame banget nih, lagu lu nunggu giliran bentar ya.")
+                    else:
+                        self.waiting_for_ffmpeg = False
+                        self.starting = True
+                        await self.play_next()
+                except Exception as e:
+                    print(f"Error di player server {self.guild_id}: {e}")
+                finally:
+                    self.starting = False
+
+                if not self.ctx.voice_client or not self.ctx.voice_client.is_connected():
+                    continue
+                timeout = self._idle_remaining()
+                if timeout is not None and timeout <= 0:
+                    await self._leave_idle()
+                    continue
+                if self.waiting_for_ffmpeg:
+                    timeout = FFMPEG_WAIT_POLL if timeout is None else min(timeout, FFMPEG_WAIT_POLL)
+                try:
+                    await asyncio.wait_for(self.wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if players.get(self.guild_id) is self:
+                del players[self.guild_id]
+
+    async def _leave_idle(self):
+        print(f"Voice di server {self.guild_id} sepi {VOICE_IDLE_TIMEOUT} detik, bot cabut.")
+        metrics.inc("voice_idle_disconnects_total")
+        reset_music_state(self.guild_id)
+        await self.ctx.voice_client.disconnect()
+        try:
+            await self.ctx.send("Sepi banget nih, gua cabut dulu ya. Panggil lagi pake `!play` kalo mau dengerin.")
+        except discord.HTTPException:
+            pass
+
+    async def play_next(self):
+        ctx = self.ctx
+        guild_id = self.guild_id
+        if ctx.voice_client.is_playing() or ctx.voice_client.is_paused():
+            return
+
+        # Lagu yang gagal di-resolve dilewatin pake loop (bukan rekursi), dibatesin biar playlist yang isinya rusak semua gak nge-spam
+        failures = []
+        played = False
+        queue = music_queues.get(guild_id)
+        while queue and len(failures) < MUSIC_MAX_CONSECUTIVE_FAILURES and ctx.voice_client and ctx.voice_client.is_connected():
+            song = queue.popleft()
             try:
-                fut.result(timeout=5)
+                source = take_prefetched(guild_id, song)
+                if source is None:
+                    await revalidate_song(song, guild_id)
+                    source = make_audio_source(song)
+                ctx.voice_client.play(source, after=self._after_playing)
             except Exception as e:
-                print(f"Error pas ngejalanin play_next dari after_playing: {e}")
+                print(f"Gila, error pas mau mulai muter lagu: {e}")
+                failures.append((song, e))
+                queue = music_queues.get(guild_id)
+                continue
+            self.starting = False   # Udah kehitung sebagai yang lagi muter
+            song['started_at'] = time.monotonic()
+            now_playing[guild_id] = song
+            audio_cache.record_play(song)
+            schedule_prefetch(ctx)
+            refresh_panel(guild_id, ctx.channel)   # Panel "Lagi Muterin" di-edit, bukan kirim embed baru tiap lagu
+            played = True
+            break
+
+        if failures:
+            self._report_failures(failures, gave_up=not played and bool(music_queues.get(guild_id)))
+        if not played:
+            if now_playing.pop(guild_id, None) is not None:
+                refresh_panel(guild_id)
+            if not music_queues.get(guild_id):
+                print("Antrian kosong, nunggu lagu baru (atau cabut kalo kelamaan sepi).")
+
+    def _after_playing(self, error):
+        # Jalan di thread audio: jangan nungguin apa-apa di sini, cukup bangunin player-nya
+        if error:
+            print(f"Anjir, error pas muter lagu: {error}")
+            self._loop.call_soon_threadsafe(outbox.post, self.ctx.channel, f"Waduh, ada error pas muter lagu, bray. Mungkin lagunya gak bisa diakses.\n`{error}`")
+        else:
+            print("Lagu selesai diputer.")
+        self._loop.call_soon_threadsafe(self._track_finished)
 
-        try:
-            source = discord.FFmpegPCMAudio(song['url'], **FFMPEG_OPTIONS)
-            ctx.voice_client.play(source, after=after_playing)
-            
+    def _report_failures(self, failures, gave_up):
+        """Satu pesan buat semua lagu yang gagal di putaran ini."""
+        if len(failures) == 1:
+            message = f"Gila, error pas mau mulai muter lagu: `{failures[0][1]}`"
+        else:
+            song, error = failures[-1]
+            message = f"⚠️ {len(failures)} lagu gagal diputer dan di-skip (terakhir: **{song['title']}** → `{error}`)."
+        if gave_up:
+            message += "\nKebanyakan yang gagal, gua berhenti dulu. Ketik `!play` lagi buat lanjut nyoba sisa antrian."
+        outbox.post(self.ctx.channel, message)
+
+def start_player(ctx):
+    """Player buat server ini (dibikin kalo belom ada), terus dibangunin."""
+    player = players.get(ctx.guild.id)
+    if player is None or player.task.done():
+        player = players[ctx.guild.id] = GuildPlayer(ctx)
+    player.notify(ctx)
+    return player
+
+async def close_players():
+    tasks = [player.task for player in players.values()]
+    tasks += [panel._task for panel in now_playing_panels.values() if panel._task is not None]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+@bot.listen("on_voice_state_update")
+async def wake_player_on_voice_change(member, before, after):
+    # Orang masuk/keluar (atau bot-nya ditendang): biar player ngecek ulang status sepinya
+    player = players.get(member.guild.id)
+    if player is not None:
+        player.notify()
+
+metrics.gauge("music_players", lambda: len(players))
+
+# --- PANEL "LAGI MUTERIN" (SATU PESAN PER SERVER, DI-EDIT) ---
+NOW_PLAYING_REPOST_AFTER = 600   # Kalo panelnya udah ketimbun chat segini lama (detik), kirim ulang di bawah
+
+now_playing_panels = {}   # guild_id -> NowPlayingPanel
+
+class NowPlayingPanel:
+    """Satu pesan status musik per server yang di-edit tiap ganti lagu/antrian, bukan kirim embed baru.
+
+    Perubahan yang dateng beruntun (skip berkali-kali, !play rame-rame) cuma jadi satu edit.
+    """
+    def __init__(self, guild_id, channel):
+        self.guild_id = guild_id
+        self.channel = channel
+        self.message = None
+        self.posted_at = 0.0
+        self._dirty = False
+        self._task = None
+
+    def refresh(self, channel=None):
+        if channel is not None:
+            self.channel = channel
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._render_loop())
+
+    async def _render_loop(self):
+        while self._dirty:
+            await asyncio.sleep(OUTBOX_DELAY)
+            self._dirty = False
+            try:
+                await self._render()
+            except discord.HTTPException as e:
+                print(f"Gagal update panel musik di server {self.guild_id}: {e}")
+
+    def _buried(self):
+        if self.message.channel.id != self.channel.id:
+            return True
+        if getattr(self.channel, 'last_message_id', None) == self.message.id:
+            return False
+        return time.monotonic() - self.posted_at > NOW_PLAYING_REPOST_AFTER
+
+    async def _render(self):
+        embed = self.build_embed()
+        if self.message is not None:
+            if not self._buried():
+                try:
+                    await self.message.edit(embed=embed)
+                    metrics.inc("now_playing_panel_edits_total")
+                    return
+                except discord.NotFound:
+                    self.message = None   # Panelnya udah dihapus orang
+            else:
+                try:
+                    await self.message.delete()
+                except discord.HTTPException:
+                    pass
+        self.message = await self.channel.send(embed=embed)
+        self.posted_at = time.monotonic()
+
+    def build_embed(self):
+        song = now_playing.get(self.guild_id)
+        queue = music_queues.get(self.guild_id)
+        if song is not None:
             embed = discord.Embed(title="🎶 Lagi Muterin", description=f"**{song['title']}**", color=discord.Color.purple())
-            await ctx.send(embed=embed)
-        except Exception as e:
-            error_message = f"Gila, error pas mau mulai muter lagu: `{e}`"
-            print(error_message) 
-            await ctx.send(error_message) 
-            await play_next(ctx)
-    else:
-        print("Antrian kosong, bot diem di channel.")
+            if song.get('duration'):
+                embed.add_field(name="Durasi", value=format_duration(song['duration']), inline=True)
+        else:
+            embed = discord.Embed(title="⏹️ Gak Ada Yang Diputer", description="Antrian abis. Tambahin lagu pake `!play`.", color=discord.Color.greyple())
+        if queue:
+            embed.add_field(name="Berikutnya", value=queue.peek()['title'], inline=True)
+            embed.set_footer(text=f"{len(queue)} lagu di antrian · !queue buat liat semua")
+        return embed
+
+def refresh_panel(guild_id, channel=None):
+    """Update panel musik server ini. Panel baru cuma dibikin kalo channel-nya dikasih (pas lagu mulai)."""
+    panel = now_playing_panels.get(guild_id)
+    if panel is None:
+        if channel is None:
+            return
+        panel = now_playing_panels[guild_id] = NowPlayingPanel(guild_id, channel)
+    panel.refresh(channel)
+
+def drop_panel(guild_id):
+    panel = now_playing_panels.pop(guild_id, None)
+    if panel is not None and panel._task is not None:
+        panel._task.cancel()
+
+# --- TAMPILAN ANTRIAN (PER HALAMAN) ---
+QUEUE_PAGE_SIZE = 10
+QUEUE_TITLE_MAX = 80
+
+class QueueView(discord.ui.View):
+    """Tombol halaman buat !queue. Yang dirender cuma lagu di halaman yang lagi dibuka."""
+    def __init__(self, author_id, guild_id):
+        super().__init__(timeout=120)
+        self.author_id = author_id
+        self.guild_id = guild_id
+        self.page = 0
+        self.message = None
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Ketik `!queue` sendiri aja, bray!", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    def build_embed(self):
+        queue = music_queues.get(self.guild_id) or Playlist()
+        pages = max(1, -(-len(queue) // QUEUE_PAGE_SIZE))
+        self.page = max(0, min(self.page, pages - 1))
+        start = self.page * QUEUE_PAGE_SIZE
+
+        lines = []
+        for number, song in enumerate(queue.snapshot(start, QUEUE_PAGE_SIZE), start=start + 1):
+            title = song['title'] if len(song['title']) <= QUEUE_TITLE_MAX else song['title'][:QUEUE_TITLE_MAX - 1] + "…"
+            duration = f" `{format_duration(song['duration'])}`" if song.get('duration') else ""
+            lines.append(f"**#{number}.** {title}{duration}")
+        embed = discord.Embed(title="📜 Antrian Lagu", description="\n".join(lines) or "Antrian lagu kosong, bray!", color=discord.Color.blue())
+
+        current = now_playing.get(self.guild_id)
+        if current:
+            embed.add_field(name="Lagi Muterin", value=current['title'], inline=False)
+        total = format_duration(queue.total_duration)
+        if queue.unknown_durations:
+            total += f" + {queue.unknown_durations} lagu belom ketauan durasinya"
+        embed.set_footer(text=f"Halaman {self.page + 1}/{pages} · {len(queue)} lagu · total {total}")
+
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= pages - 1
+        return embed
+
+    @discord.ui.button(label="Sebelumnya", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @discord.ui.button(label="Berikutnya", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
 
 # --- KUMPULAN PERINTAH MUSIK (COG) ---
 class MusicCog(commands.Cog):
@@ -422,6 +2763,7 @@ class MusicCog(commands.Cog):
             await ctx.voice_client.move_to(channel)
         else:
             await channel.connect()
+        start_player(ctx)   # Biar ikut dicabut otomatis kalo gak ada yang nyetel lagu
         await ctx.send(f"Udah join ke **{channel.name}**!")
 
     @commands.command(name="play", help="Muterin lagu dari YouTube atau Spotify (link atau judul)")
@@ -437,46 +2779,46 @@ class MusicCog(commands.Cog):
             await ctx.voice_client.move_to(channel)
 
         if ctx.guild.id not in music_queues:
-            music_queues[ctx.guild.id] = asyncio.Queue()
+            music_queues[ctx.guild.id] = Playlist()
 
         # --- LOGIKA BARU BUAT SPOTIFY ---
-        search_query = query
-        spotify_track_regex = r"(https?://)?(www\.)?open\.spotify\.com/track/([a-zA-Z0-9]+)"
-        match = re.match(spotify_track_regex, query)
-
-        if match and sp:
+        song = make_queue_entry(query)
+        match = SPOTIFY_URL_REGEX.match(query)
+
+        if match and spotify.enabled:
+            kind, spotify_id = match.group(4), match.group(5)
+            if kind != "track":
+                start_spotify_ingest(ctx, kind, spotify_id)
+                outbox.post(ctx.channel, f"🔍 Nemu {kind} Spotify. Lagunya gua masukin ke antrian sambil jalan, lagu pertama langsung diputer...")
+                return
             try:
-                track_id = match.group(3)
-                track = sp.track(track_id)
-                track_name = track['name']
-                artist_name = track['artists'][0]['name']
-                search_query = f"{track_name} {artist_name}"
-                await ctx.send(f"🔍 Nemu lagu Spotify: **{track_name} - {artist_name}**. Nyari di YouTube...")
+                track_name, artist_name = await spotify.track(spotify_id)
+                song = spotify_queue_entry(track_name, artist_name)
+                outbox.post(ctx.channel, f"🔍 Nemu lagu Spotify: **{song['title']}**. Nyari di YouTube...")
             except Exception as e:
                 await ctx.send(f"Waduh, gagal ngambil info dari link Spotify itu. Error: `{e}`")
                 return
-        elif match and not sp:
+        elif match and not spotify.enabled:
             await ctx.send("Fitur Spotify belom aktif, bray. Cek lagi `SPOTIPY_CLIENT_ID` dan `SPOTIPY_CLIENT_SECRET` di file .env lu.")
             return
         # --- AKHIR LOGIKA SPOTIFY ---
 
-        try:
-            song = await get_song_info(search_query)
-            await music_queues[ctx.guild.id].put(song)
-            await ctx.send(f"✅ **{song['title']}** udah masuk antrian!")
-
-            if not ctx.voice_client.is_playing() and not ctx.voice_client.is_paused():
-                await play_next(ctx)
+        # Lagunya baru di-resolve ke YouTube pas mau diputer (atau pas di-prefetch)
+        music_queues[ctx.guild.id].append(song)
+        outbox.post(ctx.channel, f"✅ **{song['title']}** udah masuk antrian!")   # !play beruntun jadi satu pesan
 
-        except Exception as e:
-            await ctx.send(f"Waduh, error pas nyari lagu: `{str(e)}`")
+        if not ctx.voice_client.is_playing() and not ctx.voice_client.is_paused():
+            start_player(ctx)
+        else:
+            schedule_prefetch(ctx)
+            refresh_panel(ctx.guild.id)
 
 
     @commands.command(name="skip", help="Ngelewatin lagu yang lagi diputer")
     async def skip(self, ctx):
         if ctx.voice_client and ctx.voice_client.is_playing():
             ctx.voice_client.stop()
-            await ctx.send("Lagu di-skip!")
+            outbox.post(ctx.channel, "Lagu di-skip!")
         else:
             await ctx.send("Lagi gak ada lagu yang diputer, bray.")
             
@@ -499,29 +2841,77 @@ class MusicCog(commands.Cog):
     @commands.command(name="stop", help="Berhentiin musik dan keluar dari voice channel")
     async def stop(self, ctx):
         if ctx.voice_client:
-            if ctx.guild.id in music_queues:
-                while not music_queues[ctx.guild.id].empty():
-                    await music_queues[ctx.guild.id].get()
-            
+            reset_music_state(ctx.guild.id)
             await ctx.voice_client.disconnect()
             await ctx.send("Oke, gua cabut. Makasih udah dengerin!")
         else:
             await ctx.send("Gua aja kaga di voice channel.")
 
+    @commands.command(name="lookahead", help="Ngatur berapa lagu di depan yang disiapin duluan (0-3)")
+    @commands.guild_only()
+    @commands.has_permissions(manage_guild=True)
+    async def lookahead(self, ctx, depth: int):
+        depth = max(0, min(depth, MUSIC_MAX_LOOKAHEAD))
+        lookahead_depth[ctx.guild.id] = depth
+        if depth == 0:
+            cancel_prefetch(ctx.guild.id)
+            await ctx.send("Prefetch dimatiin buat server ini.")
+        else:
+            if ctx.voice_client and ctx.voice_client.is_playing():
+                schedule_prefetch(ctx)
+            await ctx.send(f"Oke, gua bakal nyiapin **{depth}** lagu di depan.")
+
+    @lookahead.error
+    async def lookahead_error(self, ctx, error):
+        if isinstance(error, commands.MissingPermissions):
+            await ctx.send("Lu kaga punya izin buat pake perintah ini, bray!")
+        elif isinstance(error, commands.NoPrivateMessage):
+            await ctx.send("Perintah ini cuma bisa dipake di server.")
+        elif isinstance(error, commands.BadArgument):
+            await ctx.send(f"Isi angka 0-{MUSIC_MAX_LOOKAHEAD}, bray. Contoh: `!lookahead 2`")
+        else:
+            await ctx.send(f"Anjir, ada error: `{error}`")
+
     @commands.command(name="queue", help="Nampilin daftar antrian lagu")
     async def queue(self, ctx):
-        guild_id = ctx.guild.id
-        if guild_id not in music_queues or music_queues[guild_id].empty():
+        if not music_queues.get(ctx.guild.id):
             await ctx.send("Antrian lagu kosong, bray!")
             return
-
-        embed = discord.Embed(title="📜 Antrian Lagu", color=discord.Color.blue())
-        queue_list = list(music_queues[guild_id]._queue)
-
-        for i, song in enumerate(queue_list):
-            embed.add_field(name=f"#{i+1}. {song['title']}", value=" ", inline=False)
-        
-        await ctx.send(embed=embed)
+        view = QueueView(ctx.author.id, ctx.guild.id)
+        view.message = await ctx.send(embed=view.build_embed(), view=view)
+
+    @commands.command(name="remove", help="Buang lagu dari antrian (pake nomer dari !queue)")
+    async def remove(self, ctx, position: int):
+        queue = music_queues.get(ctx.guild.id)
+        if not queue or not 1 <= position <= len(queue):
+            await ctx.send("Nomer lagunya gak ada di antrian, bray. Cek dulu pake `!queue`.")
+            return
+        song = queue.remove(position - 1)
+        schedule_prefetch(ctx)
+        refresh_panel(ctx.guild.id)
+        outbox.post(ctx.channel, f"🗑️ **{song['title']}** dibuang dari antrian.")
+
+    @commands.command(name="movesong", help="Pindahin lagu di antrian: !movesong <dari> <ke>")
+    async def movesong(self, ctx, position: int, new_position: int):
+        queue = music_queues.get(ctx.guild.id)
+        if not queue or not 1 <= position <= len(queue) or not 1 <= new_position <= len(queue):
+            await ctx.send("Nomer lagunya gak ada di antrian, bray. Cek dulu pake `!queue`.")
+            return
+        song = queue.move(position - 1, new_position - 1)
+        schedule_prefetch(ctx)
+        refresh_panel(ctx.guild.id)
+        outbox.post(ctx.channel, f"↕️ **{song['title']}** dipindah ke nomer {new_position}.")
+
+    @commands.command(name="shuffle", help="Ngacak urutan antrian lagu")
+    async def shuffle(self, ctx):
+        queue = music_queues.get(ctx.guild.id)
+        if not queue:
+            await ctx.send("Antrian lagu kosong, bray!")
+            return
+        queue.shuffle()
+        schedule_prefetch(ctx)
+        refresh_panel(ctx.guild.id)
+        outbox.post(ctx.channel, f"🔀 {len(queue)} lagu di antrian udah diacak!")
 
 # --- MODUL MODERASI (BARU!) ---
 class ModerationCog(commands.Cog):
@@ -593,10 +2983,43 @@ async def main():
         print("Error: Token Discord tidak ditemukan di file .env. Bot tidak bisa dijalankan.")
         return
         
-    async with bot:
-        await bot.add_cog(MusicCog(bot))      # 'Nempel'in modul musik ke bot
-        await bot.add_cog(ModerationCog(bot)) # 'Nempel'in modul hansip ke bot
-        await bot.start(DISCORD_TOKEN)
+    global gateway_started
+    record_phase("import modul", BOOT_STARTED)
+    started = time.perf_counter()
+    await metrics.start()                 # Pengukur lag event loop (+ endpoint /metrics kalo METRICS_PORT diisi)
+    await gemini_client.start()           # Satu session HTTP buat semua panggilan Gemini
+    extraction_pool.start()               # Worker yt-dlp yang udah anget
+    audio_cache.load()                    # Index file audio lokal (kalo AUDIO_CACHE_DIR diisi)
+    score_store.start()                   # Skor dimuat ke memori sekali aja
+    game_states.start_sweeper()           # Sesi game yang ditinggal dibuang berkala
+    quiz_pool.start()                     # Produser stok kuis jalan di background
+    if CLUSTER_ID:
+        heartbeat_task = asyncio.create_task(cluster_heartbeat())   # Dipantau sama supervisor di cluster.py
+    record_phase("inisialisasi subsistem", started)
+    try:
+        async with bot:
+            # SIGTERM (deploy Railway/Heroku, restart dari cluster.py) lewat bot.close() biar skor & cache sempet disimpen di finally
+            try:
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+            except NotImplementedError:
+                pass   # Windows gak punya add_signal_handler
+            await bot.add_cog(MusicCog(bot))      # 'Nempel'in modul musik ke bot
+            await bot.add_cog(ModerationCog(bot)) # 'Nempel'in modul hansip ke bot
+            gateway_started = time.perf_counter()
+            await bot.start(DISCORD_TOKEN)
+    finally:
+        if CLUSTER_ID:
+            heartbeat_task.cancel()
+        await quiz_pool.close()
+        await game_states.close()
+        await gemini_client.close()
+        extraction_pool.close()
+        spotify.close()
+        await score_store.close()
+        track_cache.save()
+        answer_cache.save()
+        shared_store.close()
+        await metrics.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,162 @@
+"""Launcher mode cluster: bagi-bagi shard Discord ke beberapa proses bot_discord.py.
+
+Tiap worker dapet SHARD_COUNT, SHARD_IDS, dan CLUSTER_ID lewat environment,
+terus jalan sebagai AutoShardedBot. Supervisor di sini nyalain ulang worker
+yang mati, dan yang heartbeat-nya di cluster_state.db udah basi (proses
+nyangkut / event loop ke-block).
+
+Konfigurasi (.env):
+    SHARD_COUNT      total shard (kosong = pake rekomendasi Discord)
+    CLUSTER_WORKERS  jumlah proses (default: jumlah core, maksimal sejumlah shard)
+"""
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+CLUSTER_WORKERS = os.getenv("CLUSTER_WORKERS")
+CLUSTER_STATE_DB = os.getenv("CLUSTER_STATE_DB", "cluster_state.db")
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_discord.py")
+
+HEALTH_CHECK_INTERVAL = 15
+HEARTBEAT_TIMEOUT = 90          # Worker dianggep nyangkut kalo heartbeat-nya lebih tua dari ini
+STARTUP_GRACE = 180             # Waktu buat login + nyambung semua shard sebelum mulai dicek
+RESTART_BACKOFF_MAX = 60
+STABLE_AFTER = 300              # Kalo udah jalan segini lama, backoff restart-nya di-reset
+
+
+async def recommended_shard_count():
+    """Nanya Discord butuh berapa shard buat bot ini (GET /gateway/bot)."""
+    headers = {"Authorization": f"Bot {DISCORD_TOKEN}"}
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot", headers=headers) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data["shards"]
+
+
+def split_shards(shard_count, workers):
+    """Bagi shard 0..shard_count-1 jadi range yang nyambung, serata mungkin."""
+    base, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def read_heartbeat(cluster_id):
+    """Baca heartbeat terakhir worker dari shared store (ditulis sama cluster_heartbeat di bot_discord.py)."""
+    try:
+        conn = sqlite3.connect(CLUSTER_STATE_DB, timeout=5)
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (f"heartbeat:{cluster_id}",)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return json.loads(row[0]) if row else None
+
+
+class Worker:
+    def __init__(self, cluster_id, shard_ids, shard_count):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.started_at = 0.0
+        self.backoff = 1.0
+
+    async def start(self):
+        env = dict(
+            os.environ,
+            SHARD_COUNT=str(self.shard_count),
+            SHARD_IDS=",".join(map(str, self.shard_ids)),
+            CLUSTER_ID=str(self.cluster_id),
+            CLUSTER_STATE_DB=CLUSTER_STATE_DB,
+        )
+        self.process = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=env)
+        self.started_at = time.monotonic()
+        print(f"[cluster] Worker {self.cluster_id} (shard {self.shard_ids[0]}-{self.shard_ids[-1]}) nyala, pid {self.process.pid}")
+
+    def is_stale(self):
+        if time.monotonic() - self.started_at < STARTUP_GRACE:
+            return False
+        heartbeat = read_heartbeat(self.cluster_id)
+        if heartbeat is None or heartbeat.get("pid") != self.process.pid:
+            return True
+        return time.time() - heartbeat["ts"] > HEARTBEAT_TIMEOUT
+
+    def terminate(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+    async def supervise(self, stopping):
+        while not stopping.is_set():
+            await self.start()
+            health = asyncio.create_task(self._watch_health(stopping))
+            returncode = await self.process.wait()
+            health.cancel()
+            if stopping.is_set():
+                return
+            if time.monotonic() - self.started_at > STABLE_AFTER:
+                self.backoff = 1.0
+            print(f"[cluster] Worker {self.cluster_id} mati (kode {returncode}), nyalain ulang {self.backoff:.0f} detik lagi")
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=self.backoff)
+            except asyncio.TimeoutError:
+                pass
+            self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+
+    async def _watch_health(self, stopping):
+        while not stopping.is_set():
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            if self.process.returncode is None and self.is_stale():
+                print(f"[cluster] Worker {self.cluster_id} gak ngirim heartbeat, dimatiin biar di-restart")
+                self.terminate()
+                try:
+                    await asyncio.wait_for(self.process.wait(), timeout=10)
+                except asyncio.TimeoutError:
+                    self.process.kill()
+                return
+
+
+async def main():
+    if not DISCORD_TOKEN:
+        print("Error: Token Discord tidak ditemukan di file .env. Cluster tidak bisa dijalankan.")
+        return
+
+    shard_count = int(SHARD_COUNT) if SHARD_COUNT else await recommended_shard_count()
+    workers = int(CLUSTER_WORKERS) if CLUSTER_WORKERS else (os.cpu_count() or 1)
+    workers = max(1, min(workers, shard_count))
+    print(f"[cluster] {shard_count} shard dibagi ke {workers} worker")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    pool = [Worker(i, shard_ids, shard_count) for i, shard_ids in enumerate(split_shards(shard_count, workers))]
+    supervisors = [asyncio.create_task(worker.supervise(stopping)) for worker in pool]
+
+    await stopping.wait()
+    print("[cluster] Dimatiin, nungguin semua worker berhenti...")
+    for worker in pool:
+        worker.terminate()
+    await asyncio.gather(*supervisors, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
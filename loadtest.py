@@ -0,0 +1,443 @@
+"""Load test offline buat bot_discord.py.
+
+Ngejalanin callback perintah yang asli (MusicCog.play, GuildPlayer, ask_gemini,
+mesin kuis, leaderboard) pake context, voice client, yt-dlp, dan Gemini palsu.
+Gak ada koneksi ke Discord, YouTube, atau Google sama sekali.
+
+Contoh:
+    python loadtest.py --guilds 50 --users 5
+    python loadtest.py --scenarios play,tanya --extract-latency 1.5 --gemini-latency 0.8
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import threading
+import time
+import types
+
+from aiohttp import web
+
+# Biar bot_discord gak nyoba nyambung ke mana-mana pas di-import. Harus diisi
+# string kosong, bukan di-pop: load_dotenv() bakal ngisi lagi yang ilang dari .env
+for _name in ("DISCORD_TOKEN", "SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET", "YT_COOKIES", "AUDIO_CACHE_DIR",
+              "TRACK_CACHE_FILE", "ANSWER_CACHE_FILE", "CLUSTER_ID", "SHARD_COUNT", "SHARD_IDS"):
+    os.environ[_name] = ""
+os.environ["METRICS_PORT"] = "0"
+os.environ["BOT_SHARDED"] = "0"
+
+import bot_discord  # noqa: E402
+
+_ids = itertools.count(1_000_000)
+
+
+# --- STUB YT-DLP ---
+
+class StubYoutubeDL:
+    """Pengganti yt_dlp.YoutubeDL: tidur sebentar (kayak ekstraksi beneran) terus balikin info palsu."""
+    latency = 0.5
+
+    def __init__(self, options=None):
+        self.options = options
+
+    def extract_info(self, query, download=False):
+        time.sleep(self.latency)
+        video_id = hashlib.sha1(query.encode()).hexdigest()[:11]
+        expire = int(time.time()) + 6 * 3600
+        return {
+            'id': video_id,
+            'extractor_key': 'Youtube',
+            'title': f"Stub {query}",
+            'url': f"https://rr1---sn-stub.googlevideo.com/videoplayback?expire={expire}&id={video_id}",
+            'duration': 180,
+            'acodec': 'opus',
+        }
+
+
+class FakeSource:
+    def cleanup(self):
+        pass
+
+
+# --- OBJEK DISCORD PALSU ---
+
+class FakeMessage:
+    def __init__(self, channel, author, content=""):
+        self.id = next(_ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        await asyncio.sleep(0)
+        self.content = content
+
+    async def delete(self):
+        await asyncio.sleep(0)
+
+
+class FakeChannel:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(0)   # Anggep REST-nya instan, yang diukur kerjaan bot-nya
+        self.sent += 1
+        return FakeMessage(self, None, content or "")
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = f"voice-{self.id}"
+
+    @property
+    def members(self):
+        return [member for member in self.guild.members.values() if member.voice.channel is self]
+
+    async def connect(self):
+        self.guild.voice_client = FakeVoiceClient(self)
+        return self.guild.voice_client
+
+
+class FakeVoiceClient:
+    """Voice client palsu: 'muter' lagu selama track_seconds, terus manggil after() dari thread lain kayak player aslinya."""
+    track_seconds = 0.2
+    transitions = []   # Jeda (detik) dari lagu selesai sampe lagu berikutnya mulai
+
+    def __init__(self, channel):
+        self.channel = channel
+        self._playing = False
+        self._paused = False
+        self._connected = True
+        self._timer = None
+        self._after = None
+        self._finished_at = None
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._playing
+
+    def is_paused(self):
+        return self._paused
+
+    def play(self, source, after=None):
+        if self._finished_at is not None:
+            FakeVoiceClient.transitions.append(time.perf_counter() - self._finished_at)
+            self._finished_at = None
+        self._playing = True
+        self._after = after
+        self._timer = threading.Timer(self.track_seconds, self._finish)
+        self._timer.start()
+
+    def _finish(self):
+        self._playing = False
+        self._finished_at = time.perf_counter()
+        if self._after is not None:
+            self._after(None)
+
+    def stop(self):
+        if self._playing and self._timer is not None:
+            self._timer.cancel()
+            threading.Thread(target=self._finish).start()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self):
+        self._connected = False
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+class FakeGuild:
+    def __init__(self):
+        self.id = next(_ids)
+        self.name = f"guild-{self.id}"
+        self.voice_client = None
+        self.text_channel = FakeChannel(self)
+        self.voice_channel = FakeVoiceChannel(self)
+        self.members = {}
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+        self.display_name = f"user-{self.id}"
+        self.name = self.display_name
+        self.mention = f"<@{self.id}>"
+        self.bot = False
+        self.voice = FakeVoiceState(guild.voice_channel)
+        guild.members[self.id] = self
+
+
+class FakeContext:
+    def __init__(self, guild, author):
+        self.guild = guild
+        self.author = author
+        self.channel = guild.text_channel
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+# --- GEMINI PALSU (SERVER AIOHTTP LOKAL) ---
+
+async def start_fake_gemini(latency, answer_chars):
+    answer = ("Ini jawaban palsu buat load test. " * (answer_chars // 34 + 1))[:answer_chars]
+
+    async def handle(request):
+        await request.read()
+        if request.path.endswith(":streamGenerateContent"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            chunks = [answer[i:i + 200] for i in range(0, len(answer), 200)]
+            for chunk in chunks:
+                await asyncio.sleep(latency / len(chunks))
+                payload = {"candidates": [{"content": {"parts": [{"text": chunk}]}}]}
+                await response.write(f"data: {json.dumps(payload)}\r\n\r\n".encode())
+            await response.write_eof()
+            return response
+        await asyncio.sleep(latency)
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": answer}]}}]})
+
+    app = web.Application()
+    app.router.add_post("/{tail:.*}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1beta/models"
+
+
+# --- SKENARIO ---
+
+async def timed(samples, coro):
+    started = time.perf_counter()
+    await coro
+    samples.append(time.perf_counter() - started)
+
+
+def guild_is_busy(guild):
+    queue = bot_discord.music_queues.get(guild.id)
+    return bool(guild.voice_client and (guild.voice_client.is_playing() or queue))
+
+
+async def scenario_play(world, args):
+    cog = bot_discord.MusicCog(bot_discord.bot)
+    samples = []
+    songs = [f"lagu nomer {i}" for i in range(args.distinct_songs)]
+    song_iter = itertools.cycle(songs)
+    FakeVoiceClient.transitions.clear()
+
+    async def user_loop(guild, member):
+        ctx = FakeContext(guild, member)
+        for _ in range(args.rounds):
+            await timed(samples, cog.play.callback(cog, ctx, query=next(song_iter)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(guild, member) for guild, members in world for member in members))
+    play_window = time.perf_counter() - started
+
+    # Tunggu semua antrian abis diputer (player + after_playing beneran jalan)
+    deadline = time.monotonic() + args.drain_timeout
+    idle_since = None
+    while time.monotonic() < deadline:
+        if any(guild_is_busy(guild) for guild, _ in world):
+            idle_since = None
+        elif idle_since is None:
+            idle_since = time.monotonic()
+        elif time.monotonic() - idle_since > args.track_seconds + 0.5:
+            break   # Udah beneran sepi, bukan cuma jeda antar lagu
+        await asyncio.sleep(0.05)
+    drain_window = time.perf_counter() - started
+    return {
+        "play": (samples, play_window),
+        "play_next transition": (list(FakeVoiceClient.transitions), drain_window),
+    }
+
+
+async def scenario_tanya(world, args):
+    samples = []
+
+    question_ids = itertools.count()
+
+    async def user_loop(guild, member):
+        ctx = FakeContext(guild, member)
+        for _ in range(args.rounds):
+            n = next(question_ids)
+            question = f"pertanyaan #{n % args.distinct_questions}" if args.distinct_questions else f"pertanyaan #{n}"
+            await timed(samples, bot_discord.ask_gemini.callback(ctx, question=question))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(guild, member) for guild, members in world for member in members))
+    window = time.perf_counter() - started
+    return {"tanya": (samples, window)}
+
+
+async def scenario_quiz(world, args):
+    answer_samples = []
+    quiz_samples = []
+    questions = [{"q": f"Soal {i}?", "a": f"jawab{i}"} for i in range(bot_discord.QUIZ_QUESTION_COUNT)]
+
+    async def user_loop(guild, member):
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            await bot_discord.start_quiz(guild.text_channel, member, list(questions))
+            for question in questions:
+                message = FakeMessage(guild.text_channel, member, question["a"])
+                await timed(answer_samples, bot_discord.quiz_dispatcher(message))
+            quiz_samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(guild, member) for guild, members in world for member in members))
+    window = time.perf_counter() - started
+    return {"quiz answer": (answer_samples, window), "quiz full": (quiz_samples, window)}
+
+
+async def scenario_leaderboard(world, args):
+    samples = []
+    for guild, members in world:
+        for member in members:
+            for _ in range(3):
+                bot_discord.score_store.add_win(guild.id, member.id)
+
+    async def user_loop(guild, member):
+        ctx = FakeContext(guild, member)
+        for _ in range(args.rounds):
+            await timed(samples, bot_discord.leaderboard.callback(ctx))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(guild, member) for guild, members in world for member in members))
+    window = time.perf_counter() - started
+    return {"skor": (samples, window)}
+
+
+SCENARIOS = {
+    "play": scenario_play,
+    "tanya": scenario_tanya,
+    "quiz": scenario_quiz,
+    "skor": scenario_leaderboard,
+}
+
+
+# --- LAPORAN ---
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def print_report(results, elapsed):
+    print(f"{'operasi':<24}{'n':>8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, samples in results:
+        ordered = sorted(samples)
+        ops = len(ordered) / elapsed[name] if elapsed.get(name) else 0.0
+        print(
+            f"{name:<24}{len(ordered):>8}{ops:>10.1f}"
+            f"{percentile(ordered, 0.5) * 1000:>10.1f}{percentile(ordered, 0.99) * 1000:>10.1f}"
+            f"{(ordered[-1] if ordered else 0) * 1000:>10.1f}"
+        )
+    print(f"event loop lag p99: {bot_discord.metrics.histogram('event_loop_lag_seconds').quantile(0.99) * 1000:.0f}ms")
+
+
+async def run(args):
+    StubYoutubeDL.latency = args.extract_latency
+    FakeVoiceClient.track_seconds = args.track_seconds
+    bot_discord.yt_dlp = types.SimpleNamespace(YoutubeDL=StubYoutubeDL)   # load_yt_dlp() gak bakal import yang asli
+    bot_discord.make_audio_source = lambda song: FakeSource()
+
+    runner, api_base = await start_fake_gemini(args.gemini_latency, args.answer_chars)
+    bot_discord.GEMINI_API_BASE = api_base
+    bot_discord.GEMINI_API_KEY = "loadtest"
+
+    world = []
+    for _ in range(args.guilds):
+        guild = FakeGuild()
+        world.append((guild, [FakeMember(guild) for _ in range(args.users)]))
+
+    results = []
+    elapsed = {}
+    log = io.StringIO()
+    async with bot_discord.bot:   # Cuma setup loop & state internal, gak login
+        await bot_discord.metrics.start(port=0)
+        await bot_discord.gemini_client.start()
+        bot_discord.extraction_pool.start()
+        try:
+            for name in args.scenarios:
+                with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log):
+                    scenario_results = await SCENARIOS[name](world, args)
+                # Tiap skenario ngukur jendela waktunya sendiri (play gak ikut ngitung nunggu antrian abis)
+                for op, (samples, window) in scenario_results.items():
+                    results.append((op, samples))
+                    elapsed[op] = window
+        finally:
+            await bot_discord.close_players()
+            await bot_discord.outbox.close()
+            await bot_discord.gemini_client.close()
+            bot_discord.extraction_pool.close()
+            await bot_discord.metrics.close()
+            await runner.cleanup()
+
+    print(f"{args.guilds} server x {args.users} user, {args.rounds} ronde per user")
+    print_report(results, elapsed)
+    print(f"pesan terkirim: {sum(guild.text_channel.sent for guild, _ in world)}")
+    cache = {result: bot_discord.metrics.counter("answer_cache_total", result=result) for result in ("hit", "miss", "coalesced")}
+    print(f"cache jawaban !tanya: {cache['hit']} hit, {cache['miss']} miss, {cache['coalesced']} nebeng")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test offline buat bot_discord.py")
+    parser.add_argument("--guilds", type=int, default=20, help="jumlah server palsu")
+    parser.add_argument("--users", type=int, default=3, help="jumlah user per server")
+    parser.add_argument("--rounds", type=int, default=3, help="berapa kali tiap user ngejalanin perintah")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"dipisah koma, pilihan: {', '.join(SCENARIOS)}")
+    parser.add_argument("--extract-latency", type=float, default=0.5, help="detik per ekstraksi yt-dlp palsu")
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="detik per jawaban Gemini palsu")
+    parser.add_argument("--answer-chars", type=int, default=1500, help="panjang jawaban Gemini palsu")
+    parser.add_argument("--distinct-songs", type=int, default=30, help="jumlah judul lagu beda (ngatur hit rate cache)")
+    parser.add_argument("--distinct-questions", type=int, default=0, help="jumlah pertanyaan beda buat !tanya (0 = semua beda, ngatur hit rate cache jawaban)")
+    parser.add_argument("--track-seconds", type=float, default=0.2, help="durasi 'lagu' palsu")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="batas nunggu antrian musik abis")
+    parser.add_argument("--verbose", action="store_true", help="tampilin print() dari bot")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"skenario gak dikenal: {', '.join(unknown)}")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))